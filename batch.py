@@ -0,0 +1,88 @@
+# compiles many programs in one process, or in a pool of processes
+# every program gets a fresh Generator, the lexer and parser tables are built once per process
+import argparse
+import io
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout, redirect_stderr
+from compiler import compile_entry
+from cache import CompilationCache
+from peephole import Peephole
+
+# (input, output, messages, success) of one compilation
+def compile_file(job):
+    input, output, peephole_rules, cache_settings = job
+    messages = io.StringIO()
+    try:
+        with open(input) as in_f:
+            text = in_f.read()
+        cache = None if cache_settings is None else CompilationCache(*cache_settings)
+        with redirect_stdout(messages), redirect_stderr(messages):
+            code = compile_entry(text, peephole_rules, cache)['code']
+    except Exception as e:
+        return input, output, f'{messages.getvalue()}Error: {e}\n', False
+    if code is None:
+        return input, output, messages.getvalue(), False
+    with open(output, 'w') as out_f:
+        for line in code:
+            print(line, file=out_f)
+    return input, output, messages.getvalue(), True
+
+# [(input, output)] from lines 'input [output]', empty lines and lines starting with # are skipped
+def read_manifest(path):
+    pairs = []
+    with open(path) as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 0 or parts[0].startswith('#'):
+                continue
+            pairs.append((parts[0], parts[1] if len(parts) > 1 else None))
+    return pairs
+
+def output_path(input, output_dir):
+    name = os.path.splitext(os.path.basename(input))[0] + '.mr'
+    if output_dir is None:
+        return os.path.join(os.path.dirname(input), name)
+    return os.path.join(output_dir, name)
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('inputs', nargs='*', help='programs to compile')
+    arguments.add_argument('--manifest', help="file with lines 'input [output]'")
+    arguments.add_argument('--output-dir', help='directory for compiled programs, next to the inputs by default')
+    arguments.add_argument('--jobs', type=int, default=1, help='number of processes, 1 compiles in this process')
+    arguments.add_argument('--cache', help='directory of the compilation cache, no cache by default')
+    arguments.add_argument('--cache-size', type=float, default=64, help='size limit of the compilation cache in MB')
+    arguments.add_argument('--peephole', default=','.join(Peephole.rules), help='comma separated peephole rules to apply, empty to disable')
+    options = arguments.parse_args()
+
+    pairs = [(input, None) for input in options.inputs]
+    if options.manifest is not None:
+        pairs += read_manifest(options.manifest)
+    if options.output_dir is not None:
+        os.makedirs(options.output_dir, exist_ok=True)
+    rules = [rule for rule in options.peephole.split(',') if rule]
+    cache_settings = None if options.cache is None else (options.cache, int(options.cache_size * 2 ** 20))
+    jobs = [(input, output or output_path(input, options.output_dir), rules, cache_settings) for input, output in pairs]
+
+    start = time.perf_counter()
+    if options.jobs > 1:
+        with ProcessPoolExecutor(options.jobs) as pool:
+            results = list(pool.map(compile_file, jobs))
+    else:
+        results = [compile_file(job) for job in jobs]
+
+    failed = 0
+    for input, output, messages, success in results:
+        print(f'{input} -> {output}' if success else f'{input}: failed')
+        if messages:
+            print(messages, end='')
+        if not success:
+            failed += 1
+    print(f'compiled {len(results) - failed} of {len(results)} programs in {time.perf_counter() - start:.2f}s')
+    return 1 if failed > 0 else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
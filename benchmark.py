@@ -0,0 +1,115 @@
+# compiles the example programs, runs them on blockvm.py and compares the costs with benchmark_baseline.json
+# test1.imp is left out, it runs for hundreds of millions of instructions
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from vm import MachineError
+from blockvm import BlockMachine
+
+directory = os.path.dirname(os.path.abspath(__file__))
+baseline_path = os.path.join(directory, 'benchmark_baseline.json')
+
+# (program, inputs, expected outputs)
+cases = [
+    ('examples1/example1.imp', [12, 23], [2, 1, 1]),
+    ('examples1/example1.imp', [1234, 5678], [704, 153, 2]),
+    ('examples1/example2.imp', [0, 1], [46368, 28657]),
+    ('examples1/example3.imp', [1], [121393]),
+    ('examples1/example4.imp', [20, 9], [167960]),
+    ('examples1/example5.imp', [1234567890, 1234567890987654321, 987654321], [674106858]),
+    ('examples1/example6.imp', [20], [2432902008176640000, 6765]),
+    ('examples1/example7.imp', [0, 0, 0], [31000, 40900, 2222010]),
+    ('examples1/example7.imp', [1, 0, 2], [31001, 40900, 2222012]),
+    ('examples1/example8.imp', [], [5, 2, 10, 4, 20, 8, 17, 16, 11, 9, 22, 18, 21, 13, 19, 3, 15, 6, 7, 12, 14, 1, 0, 1234567890] + list(range(23))),
+    ('examples1/example9.imp', [20, 9], [167960]),
+    ('examples2/test0.imp', [], [340282367713220089251654026161790386200] * 2),
+    ('examples2/test2a.imp', [], [25]),
+    ('examples2/test2b.imp', [], [25]),
+    ('examples2/test2c.imp', [], [25]),
+    ('examples2/test2d.imp', [], [25]),
+]
+
+# instructions a single run may execute
+step_limit = 10000000
+
+def case_name(program, inputs):
+    return f'{program} {inputs}'
+
+# {'cost', 'steps', 'size'} of one case, or an error message
+# with profile_guided the program is compiled with the profile of a run on the same inputs
+def measure(program, inputs, expected, compiler_options, profile_guided = False):
+    with tempfile.TemporaryDirectory() as temporary:
+        output = os.path.join(temporary, 'out.mr')
+        source = os.path.join(directory, 'example_programs', program)
+        if profile_guided:
+            profile = os.path.join(temporary, 'out.profile')
+            profiling = subprocess.run([sys.executable, os.path.join(directory, 'profiling.py'), source, profile, '--limit', str(step_limit)], input=' '.join(map(str, inputs)), capture_output=True, text=True)
+            if not os.path.exists(profile):
+                return f'profiling failed: {profiling.stdout.strip()} {profiling.stderr.strip()}'
+            compiler_options = compiler_options + ['--profile', profile]
+        compilation = subprocess.run([sys.executable, os.path.join(directory, 'compiler.py'), source, output] + compiler_options, capture_output=True, text=True)
+        if not os.path.exists(output):
+            return f'compilation failed: {compilation.stdout.strip()} {compilation.stderr.strip()}'
+        machine = BlockMachine.load(output, seed=0)
+    try:
+        result = machine.run(inputs, step_limit)
+    except MachineError as e:
+        return f'execution failed: {e}'
+    if result != expected:
+        return f'wrong output {result}, expected {expected}'
+    return {'cost': machine.cost, 'steps': machine.steps, 'size': len(machine.program)}
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--update', action='store_true', help='save the results as the new baseline')
+    arguments.add_argument('--threshold', type=float, default=1.0, help='allowed cost increase over the baseline, in percent')
+    arguments.add_argument('--profile-guided', action='store_true', help='compile every case with the profile of a run on its inputs')
+    arguments.add_argument('--compiler', default='', help='options passed to compiler.py, separated by spaces')
+    options = arguments.parse_args()
+
+    baseline = dict()
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+
+    results = dict()
+    failed = False
+    print(f'{"program":<70} {"cost":>10} {"baseline":>10} {"change":>8} {"steps":>9} {"size":>6}')
+    for program, inputs, expected in cases:
+        name = case_name(program, inputs)
+        result = measure(program, inputs, expected, options.compiler.split(), options.profile_guided)
+        if isinstance(result, str):
+            print(f'{name:<70} {result}')
+            failed = True
+            continue
+        results[name] = result
+        old = baseline.get(name)
+        change = ''
+        if old is not None:
+            percent = 100 * (result['cost'] - old['cost']) / old['cost']
+            change = f'{percent:+.1f}%'
+            if percent > options.threshold:
+                change += ' REGRESSION'
+                failed = True
+        print(f'{name:<70} {result["cost"]:>10} {old["cost"] if old else "-":>10} {change:>8} {result["steps"]:>9} {result["size"]:>6}')
+
+    total = sum(result['cost'] for result in results.values())
+    old_total = sum(baseline[name]['cost'] for name in results if name in baseline)
+    print(f'{"total":<70} {total:>10} {old_total:>10}')
+
+    if options.update:
+        if failed and len(results) < len(cases):
+            print('not updating the baseline, some programs failed')
+            return 1
+        with open(baseline_path, 'w') as file:
+            json.dump(results, file, indent=2)
+            file.write('\n')
+        print(f'baseline saved to {baseline_path}')
+        return 0
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
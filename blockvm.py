@@ -0,0 +1,159 @@
+# register machine that runs basic blocks translated to Python functions, for long running programs
+# outputs, costs and counters are the same as those of vm.Machine
+import sys
+from vm import Machine, MachineError, registers, costs, io_costs, with_register, with_address
+
+ends = ('JUMP', 'JPOS', 'JZERO', 'JUMPR', 'HALT')
+
+class Block:
+    def __init__(self, start, end, function):
+        # addresses of the first and the last instruction, the last one is the only jump
+        self.start = start
+        self.end = end
+        self.function = function
+        self.steps = end - start + 1
+
+class BlockMachine(Machine):
+    def __init__(self, program, seed = None):
+        super().__init__(program, seed)
+        # address -> Block starting there, translated once and freed with the machine
+        self.blocks = dict()
+
+    def block(self, start):
+        if start < 0 or start >= len(self.program):
+            raise MachineError(f'call of nonexistent instruction {start}')
+        end = start
+        while self.program[end][0] not in ends:
+            end += 1
+            if end == len(self.program):
+                raise MachineError(f'call of nonexistent instruction {end}')
+        block = Block(start, end, translate(start, self.program[start:end + 1]))
+        self.blocks[start] = block
+        return block
+
+    def run(self, inputs = (), limit = None):
+        program = self.program
+        # READ takes inputs from the end
+        inputs = list(reversed(list(inputs)))
+        memory = dict()
+        # registers start with random values, drawn in the same order as in vm.Machine
+        r = [self.random.randrange(2 ** 31) for reg in registers]
+        self.output = []
+        if len(program) == 0:
+            raise MachineError('empty program')
+
+        # address -> times a block was entered there, the cost is added up once the program halts
+        entries = [0] * len(program)
+        blocks = self.blocks
+        output = self.output
+        lr = 0
+        if limit is None:
+            functions = {start: block.function for start, block in blocks.items()}
+            while lr >= 0:
+                function = functions.get(lr)
+                if function is None:
+                    function = functions[lr] = self.block(lr).function
+                entries[lr] += 1
+                lr = function(r, memory, inputs, output)
+        else:
+            steps = 0
+            while lr >= 0:
+                block = blocks.get(lr) or self.block(lr)
+                entries[lr] += 1
+                lr = block.function(r, memory, inputs, output)
+                steps += block.steps
+                # the HALT itself is counted but never stops a program
+                if steps - (lr < 0) > limit:
+                    raise MachineError(f'more than {limit} instructions executed')
+
+        self.cost = 0
+        self.io_cost = 0
+        self.steps = 0
+        self.operation_counts = {operation: 0 for operation in with_register + with_address + ('READ', 'WRITE', 'HALT')}
+        self.address_counts = [0] * len(program)
+        for start, count in enumerate(entries):
+            if count == 0:
+                continue
+            block = blocks[start]
+            self.steps += block.steps * count
+            for address in range(block.start, block.end + 1):
+                operation = program[address][0]
+                self.address_counts[address] += count
+                self.operation_counts[operation] += count
+                if operation in io_costs:
+                    self.io_cost += io_costs[operation] * count
+                elif operation != 'HALT':
+                    self.cost += costs.get(operation, 1) * count
+        self.cost += self.io_cost
+        return self.output
+
+# function(registers, memory, reversed inputs, output) running the instructions from start
+# returns the address of the next block, or -1 after HALT
+def translate(start, instructions):
+    lines = [f'def block(r, memory, inputs, output):', f'    {", ".join(registers)} = r']
+    written = set()
+    for offset, (operation, x) in enumerate(instructions):
+        address = start + offset
+        if operation in ('PUT', 'RST', 'INC', 'DEC', 'SHL', 'SHR', 'STRK'):
+            written.add(x)
+        elif operation in ('LOAD', 'ADD', 'SUB', 'GET', 'READ'):
+            written.add('a')
+        if operation == 'LOAD':
+            lines.append(f'    a = memory.get({x}, 0)')
+        elif operation == 'STORE':
+            lines.append(f'    memory[{x}] = a')
+        elif operation == 'ADD':
+            lines.append(f'    a += {x}')
+        elif operation == 'SUB':
+            lines.append(f'    a = a - {x} if a > {x} else 0')
+        elif operation == 'GET':
+            lines.append(f'    a = {x}')
+        elif operation == 'PUT':
+            lines.append(f'    {x} = a')
+        elif operation == 'RST':
+            lines.append(f'    {x} = 0')
+        elif operation == 'INC':
+            lines.append(f'    {x} += 1')
+        elif operation == 'DEC':
+            lines.append(f'    {x} = {x} - 1 if {x} > 0 else 0')
+        elif operation == 'SHL':
+            lines.append(f'    {x} <<= 1')
+        elif operation == 'SHR':
+            lines.append(f'    {x} >>= 1')
+        elif operation == 'STRK':
+            lines.append(f'    {x} = {address}')
+        elif operation == 'READ':
+            lines.append(f'    if len(inputs) == 0:')
+            lines.append(f'        raise MachineError("READ at {address} with no input left")')
+            lines.append(f'    a = inputs.pop()')
+        elif operation == 'WRITE':
+            lines.append(f'    output.append(a)')
+    # registers are written back before the jump
+    lines += [f'    r[{registers.index(reg)}] = {reg}' for reg in sorted(written)]
+    if operation == 'JUMP':
+        lines.append(f'    return {x}')
+    elif operation == 'JPOS':
+        lines.append(f'    return {x} if a > 0 else {address + 1}')
+    elif operation == 'JZERO':
+        lines.append(f'    return {x} if a == 0 else {address + 1}')
+    elif operation == 'JUMPR':
+        lines.append(f'    return {x}')
+    else: # operation == 'HALT'
+        lines.append(f'    return -1')
+    namespace = {'MachineError': MachineError}
+    exec('\n'.join(lines), namespace)
+    return namespace['block']
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(f'usage: {sys.argv[0]} program', file=sys.stderr)
+        sys.exit(1)
+    machine = BlockMachine.load(sys.argv[1])
+    inputs = [int(word) for word in sys.stdin.read().split()]
+    try:
+        for value in machine.run(inputs):
+            print(f'> {value}')
+    except MachineError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+    print(f'cost: {machine.cost}; i/o: {machine.io_cost}')
@@ -0,0 +1,80 @@
+# on-disk cache of compiled programs, keyed by the source, the compiler options and the compiler itself
+# entries are evicted least recently used first once the directory grows over its size limit
+import hashlib
+import json
+import os
+
+directory = os.path.dirname(os.path.abspath(__file__))
+# modules whose changes change the generated code
+compiler_modules = ('compiler.py', 'generator.py', 'ir.py', 'propagation.py', 'inlining.py', 'peephole.py', 'tables.py')
+
+def compiler_fingerprint():
+    digest = hashlib.sha256()
+    for name in compiler_modules:
+        with open(os.path.join(directory, name), 'rb') as file:
+            digest.update(file.read())
+    return digest.hexdigest()
+
+class CompilationCache:
+    def __init__(self, path, max_bytes = 64 * 2 ** 20):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fingerprint = compiler_fingerprint()
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, text, options):
+        digest = hashlib.sha256()
+        digest.update(self.fingerprint.encode())
+        digest.update(repr(options).encode())
+        digest.update(text.encode())
+        return digest.hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.path, f'{key}.json')
+
+    # the stored entry or None, a hit marks the entry as recently used
+    def get(self, key):
+        path = self.entry_path(key)
+        try:
+            with open(path) as file:
+                entry = json.load(file)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry
+
+    def put(self, key, entry):
+        path = self.entry_path(key)
+        # written to a temporary file first, so that concurrent compilers never read half of it
+        temporary = f'{path}.{os.getpid()}'
+        try:
+            with open(temporary, 'w') as file:
+                json.dump(entry, file)
+            os.replace(temporary, path)
+        except OSError:
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total -= size
@@ -1,6 +1,13 @@
-import sys
+import time
+started = time.perf_counter()
+import argparse
+import io
+from contextlib import redirect_stdout, redirect_stderr
 from sly import Lexer, Parser
-from generator import Generator
+from generator import Generator, listing
+from peephole import Peephole
+from tables import CachedParserMeta
+imported = time.perf_counter()
 
 class MyLexer(Lexer):
     tokens = {PROGRAM, PROCEDURE, IS, IN, END, IF, THEN, ELSE, ENDIF, WHILE, DO, ENDWHILE, REPEAT, UNTIL, READ, WRITE, PID, GETS, NUM, EQ, NEQ, GEQ, LEQ, GT, LT}
@@ -59,23 +66,24 @@ class MyLexer(Lexer):
         print(f'Line {self.lineno}: illegal character {t.value[0]}')
         self.index += 1
 
-class MyParser(Parser):
+lexer_built = time.perf_counter()
+
+class MyParser(Parser, metaclass=CachedParserMeta):
     tokens = MyLexer.tokens
-    generator = Generator()
     
     @_('procedures main')
     def program_all(self, p):
-        for procedure in p.procedures:
-            self.generator.gen_procedure(*procedure)
-        self.generator.gen(*p.main)
+        return p.procedures, p.main
 
     @_('procedures PROCEDURE proc_head IS declarations IN commands END')
     def procedures(self, p):
-        return p.procedures + [(p.proc_head, p.declarations, p.commands)]
+        p.procedures.append((p.proc_head, p.declarations, p.commands))
+        return p.procedures
 
     @_('procedures PROCEDURE proc_head IS IN commands END')
     def procedures(self, p):
-        return p.procedures + [(p.proc_head, [], p.commands)]
+        p.procedures.append((p.proc_head, [], p.commands))
+        return p.procedures
 
     @_('')
     def procedures(self, p):
@@ -89,9 +97,11 @@ class MyParser(Parser):
     def main(self, p):
         return [], p.commands
 
+    # lists are extended in place, copying them would make long blocks quadratic
     @_('commands command')
     def commands(self, p):
-        return p.commands + [p.command]
+        p.commands.append(p.command)
+        return p.commands
 
     @_('command')
     def commands(self, p):
@@ -105,19 +115,19 @@ class MyParser(Parser):
 
     @_('IF condition THEN commands ELSE commands ENDIF')
     def command(self, p):
-        return 'ifelse', p.condition, p.commands0, p.commands1
+        return 'ifelse', p.condition, p.commands0, p.commands1, p.lineno
 
     @_('IF condition THEN commands ENDIF')
     def command(self, p):
-        return 'ifelse', p.condition, p.commands, []
+        return 'ifelse', p.condition, p.commands, [], p.lineno
 
     @_('WHILE condition DO commands ENDWHILE')
     def command(self, p):
-        return 'while', p.condition, p.commands
+        return 'while', p.condition, p.commands, p.lineno
 
     @_('REPEAT commands UNTIL condition ";"')
     def command(self, p):
-        return 'repeat', p.condition, p.commands
+        return 'repeat', p.condition, p.commands, p.lineno
 
     @_('proc_call ";"')
     def command(self, p):
@@ -141,11 +151,13 @@ class MyParser(Parser):
 
     @_('declarations "," PID')
     def declarations(self, p):
-        return p.declarations + [("variable", p.PID, p.lineno)]
+        p.declarations.append(("variable", p.PID, p.lineno))
+        return p.declarations
 
     @_('declarations "," PID "[" NUM "]"')
     def declarations(self, p):
-        return p.declarations + [("array", p.PID, p.NUM, p.lineno)]
+        p.declarations.append(("array", p.PID, p.NUM, p.lineno))
+        return p.declarations
 
     @_('PID')
     def declarations(self, p):
@@ -157,11 +169,13 @@ class MyParser(Parser):
     
     @_('args_decl "," PID')
     def args_decl(self, p):
-        return p.args_decl + [('variable', p.PID)]
+        p.args_decl.append(('variable', p.PID))
+        return p.args_decl
 
     @_('args_decl "," "T" PID')
     def args_decl(self, p):
-        return p.args_decl + [('array', p.PID)]
+        p.args_decl.append(('array', p.PID))
+        return p.args_decl
 
     @_('PID')
     def args_decl(self, p):
@@ -173,7 +187,8 @@ class MyParser(Parser):
 
     @_('args "," PID')
     def args(self, p):
-        return p.args + [p.PID]
+        p.args.append(p.PID)
+        return p.args
 
     @_('PID')
     def args(self, p):
@@ -260,16 +275,152 @@ class MyParser(Parser):
     #     print(f'Line {p.lineno}: incorrect READ statement')
     #     return "error"
 
-if __name__ == '__main__':
+# tokens of the lexer, with the time spent producing them added to timings['lexing']
+def timed_tokens(tokens, timings):
+    while True:
+        start = time.perf_counter()
+        token = next(tokens, None)
+        timings['lexing'] += time.perf_counter() - start
+        if token is None:
+            return
+        yield token
+
+# compiles one program with fresh generator state, the lexer and parser tables are built once per process
+# returns (code, peephole) or (None, None) when the program has errors, messages are printed
+# stats, when given, gets 'phases' with seconds per compiler phase, 'procedures' with seconds per procedure
+# and 'source map' with the (source line or None, command kind) of every instruction of the code
+# profile is {source line: times executed} of an earlier run, see profiling.py
+def compile_source(text, peephole_rules = None, stats = None, profile = None):
+    timings = {'lexing': 0}
+    start = time.perf_counter()
     lexer = MyLexer()
     parser = MyParser()
-    with open(sys.argv[1]) as in_f:
-        text = in_f.read()
+    tokens = lexer.tokenize(text)
+    if stats is not None:
+        tokens = timed_tokens(tokens, timings)
+    program = parser.parse(tokens)
+    timings['parsing'] = time.perf_counter() - start - timings['lexing']
+    generator = Generator(profile)
+    if stats is not None:
+        stats['phases'] = timings
+        stats['procedures'] = generator.procedure_timings
+    if program is not None:
+        generator.gen_program(*program)
+    timings.update(generator.timings)
+    # the parser has reported syntax errors
+    if program is None or generator.errorMode:
+        return None, None
+    start = time.perf_counter()
+    program = generator.code.program()
+    resolved = time.perf_counter()
+    timings['label resolution'] = resolved - start
+    peephole = Peephole(peephole_rules)
+    program = peephole.run(program)
+    timings['peephole'] = time.perf_counter() - resolved
+    # instructions become text only for the output
+    code = listing(program)
+    if stats is not None:
+        stats['source map'] = [generator.code.origins[index] for index in peephole.origins]
+    return code, peephole
+
+# {'code', 'messages', 'report', 'size'} of a compilation, code is None when the program has errors
+# with a CompilationCache, unchanged programs are not compiled again and their messages are replayed
+# stats are passed to compile_source, the cache is not used with them
+def compile_entry(text, peephole_rules = None, cache = None, stats = None, profile = None):
+    key = None
+    if stats is not None:
+        cache = None
+    if cache is not None:
+        key = cache.key(text, (peephole_rules, None if profile is None else sorted(profile.items())))
+        entry = cache.get(key)
+        if entry is not None:
+            print(entry['messages'], end='')
+            return entry
+    if cache is None:
+        code, peephole = compile_source(text, peephole_rules, stats, profile)
+        messages = ''
+    else:
+        output = io.StringIO()
+        # syntax errors are reported on stderr, they are replayed with the other messages
+        with redirect_stdout(output), redirect_stderr(output):
+            code, peephole = compile_source(text, peephole_rules, None, profile)
+        messages = output.getvalue()
+        print(messages, end='')
+    entry = {'code': code, 'messages': messages, 'report': None, 'size': None}
+    if peephole is not None:
+        entry['report'] = peephole.report
+        entry['size'] = peephole.size
+    if cache is not None:
+        cache.put(key, entry)
+    return entry
+
+def print_stats(stats, code):
+    for phase, seconds in stats['phases'].items():
+        print(f'{phase}: {seconds * 1000:.2f} ms')
+    print(f'total: {sum(stats["phases"].values()) * 1000:.2f} ms')
+    for name, seconds in stats['procedures'].items():
+        print(f'procedure {name}: {seconds * 1000:.2f} ms')
+    if code is None:
+        return
+    # source lines that produced the most instructions
+    sizes = dict()
+    for lineno, kind in stats['source map']:
+        if lineno is not None:
+            sizes[lineno] = sizes.get(lineno, 0) + 1
+    for lineno, size in sorted(sizes.items(), key=lambda item: -item[1])[:5]:
+        print(f'line {lineno}: {size} instructions')
+
+# lines 'index line kind instruction', the line is - for code that does not come from one statement
+def write_source_map(path, source_map, code):
+    with open(path, 'w') as map_f:
+        for index, ((lineno, kind), line) in enumerate(zip(source_map, code)):
+            print(f'{index} {"-" if lineno is None else lineno} {kind} {line}', file=map_f)
 
-    parser.parse(lexer.tokenize(text))
-    generator = parser.generator
+if __name__ == '__main__':
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('input')
+    arguments.add_argument('output')
+    arguments.add_argument('--peephole', default=','.join(Peephole.rules), help='comma separated peephole rules to apply, empty to disable')
+    arguments.add_argument('--peephole-report', action='store_true', help='print what the peephole optimizer removed')
+    arguments.add_argument('--cache', help='directory of the compilation cache, no cache by default')
+    arguments.add_argument('--cache-size', type=float, default=64, help='size limit of the compilation cache in MB')
+    arguments.add_argument('--profile', help='execution counts written by profiling.py, used to guide the optimizations')
+    arguments.add_argument('--stats', action='store_true', help='print the time of every compiler phase and write a source map to the output with .map appended')
+    arguments.add_argument('--startup-report', action='store_true', help='print how long the imports and the lexer and parser tables took')
+    options = arguments.parse_args()
+
+    if options.startup_report:
+        seconds, cached = CachedParserMeta.timings['MyParser']
+        print(f'imports: {(imported - started) * 1000:.1f} ms')
+        print(f'lexer: {(lexer_built - imported) * 1000:.1f} ms')
+        print(f'parser tables: {seconds * 1000:.1f} ms ({"loaded from cache" if cached else "built"})')
+        print(f'startup: {(time.perf_counter() - started) * 1000:.1f} ms')
+
+    with open(options.input) as in_f:
+        text = in_f.read()
 
-    if not generator.errorMode:
-        with open(sys.argv[2], 'w') as out_f:
-            for line in generator.code:
-                print(line, file=out_f)
\ No newline at end of file
+    # the cache and profiles are imported only when they are used, they would slow down every start
+    cache = None
+    if options.cache is not None:
+        from cache import CompilationCache
+        cache = CompilationCache(options.cache, int(options.cache_size * 2 ** 20))
+    stats = dict() if options.stats else None
+    profile = None
+    if options.profile is not None:
+        from profiling import read_profile
+        profile = read_profile(options.profile, text)
+    entry = compile_entry(text, [rule for rule in options.peephole.split(',') if rule], cache, stats, profile)
+    code = entry['code']
+    if stats is not None:
+        print_stats(stats, code)
+        if code is not None:
+            write_source_map(f'{options.output}.map', stats['source map'], code)
+    if code is not None:
+        if options.peephole_report:
+            for rule, count in entry['report'].items():
+                print(f'{rule}: {count}')
+            print(f'instructions: {entry["size"]} -> {len(code)}')
+
+        with open(options.output, 'w') as out_f:
+            for line in code:
+                print(line, file=out_f)
@@ -1,3 +1,11 @@
+import io
+import time
+from array import array
+from contextlib import redirect_stdout
+from propagation import ConstantPropagation, passed_by_value
+from ir import Builder, PassManager, Assign, Read, Write, Call, Initialize, Jump, Branch, bypass_empty_blocks
+from inlining import Inliner, command_count
+
 class Variable:
     def __init__(self, location):
         self.location = location
@@ -22,9 +30,11 @@ class Array:
             raise Exception(f'Index {index} is out of bounds for array {self.name}')
         
 class Pointer:
-    def __init__(self, location, type):
+    def __init__(self, location, type, by_value = False):
         self.location = location
         self.type = type
+        # parameters of procedures that never write them receive the value of the argument instead of its address
+        self.by_value = by_value
 
     def __repr__(self):
         return f'Type: {self.type}, Location: {self.location}'
@@ -32,7 +42,10 @@ class Pointer:
 class Memory(dict):
     def __init__(self, offset):
         super().__init__()
+        self.start = offset
         self.offset = offset
+        # cells handed out by add_temporary before new ones
+        self.reserved = []
 
     def add_variable(self, name):
         if name in self:
@@ -54,6 +67,37 @@ class Memory(dict):
         self.setdefault(name, Pointer(self.offset, type))
         self.offset += 1
 
+    # memory cell not visible in the program, used by the compiler
+    def add_temporary(self):
+        if len(self.reserved) > 0:
+            return self.reserved.pop(0)
+        self.offset += 1
+        return self.offset - 1
+
+    # ({name: location}, location of the temporaries, end) of the region with names in the given order
+    # and temporaries cells left before the first array
+    def layout(self, names, temporaries):
+        locations = dict()
+        location = self.start
+        reserved = None
+        for name in names:
+            if reserved is None and isinstance(self[name], Array):
+                reserved = location
+                location += temporaries
+            locations[name] = location
+            location += self[name].size if isinstance(self[name], Array) else 1
+        if reserved is None:
+            reserved = location
+            location += temporaries
+        return locations, reserved, location
+
+    # moves the cells to their locations in the layout, the temporaries are reserved for add_temporary
+    def arrange(self, names, temporaries):
+        locations, reserved, self.offset = self.layout(names, temporaries)
+        for name, location in locations.items():
+            self[name].location = location
+        self.reserved = list(range(reserved, reserved + temporaries))
+
     def is_pointer(self, name):
         if name in self:
             if not isinstance(self[name], Pointer):
@@ -113,26 +157,182 @@ class Procedure:
     def __init__(self, name, location, callback):
         self.name = name
         self.pointers = []
+        # label of the first instruction
         self.location = location
         self.callback = callback
+        # first cell after the frame, and the procedures that may be active while this one is
+        self.end = callback
+        self.callees = set()
+        # (parameters, [(local name, size or None)], commands) of procedures without errors, for inlining
+        self.body = None
+        self.size = 0
     
-    def add_pointer(self, location, type):
-        self.pointers.append(Pointer(location, type))
+    def add_pointer(self, location, type, by_value = False):
+        self.pointers.append(Pointer(location, type, by_value))
 
     def __repr__(self):
         return f'Procedure: {self.name}, location: {self.location}'
 
-        
-class Generator:
+
+# instructions of the VM, stored in Code as their index
+operations = ('READ', 'WRITE', 'LOAD', 'STORE', 'ADD', 'SUB', 'GET', 'PUT', 'RST', 'INC', 'DEC', 'SHL', 'SHR', 'JUMP', 'JPOS', 'JZERO', 'STRK', 'JUMPR', 'HALT')
+opcodes = {operation: index for index, operation in enumerate(operations)}
+jumps = ('JUMP', 'JPOS', 'JZERO')
+registers = ('a', 'b', 'c', 'd', 'e', 'f', 'g', 'h')
+
+# program as parallel arrays of opcodes and arguments, jumps go to labels that are resolved by program()
+class Code:
+    # tracks registers holding known constants, so that they are not rebuilt from scratch
     def __init__(self):
+        self.opcodes = array('B')
+        # index of the register, label of a jump or -1 for instructions without an argument
+        self.arguments = array('l')
+        # label -> position of the instruction it marks, -1 until it is placed
+        self.labels = array('l')
+        self.constants = dict()
+        # (source line or None, command kind) of every instruction, and of the ones appended next
+        self.origins = []
+        self.origin = (None, 'entry')
+
+    def __len__(self):
+        return len(self.opcodes)
+
+    # reg is a register name, or a label for jumps
+    def append(self, operation, reg = None):
+        self.opcodes.append(opcodes[operation])
+        if reg is None:
+            self.arguments.append(-1)
+        elif operation in jumps:
+            self.arguments.append(reg)
+        else:
+            self.arguments.append(registers.index(reg))
+        self.origins.append(self.origin)
+        constants = self.constants
+        if operation in ('LOAD', 'READ', 'ADD', 'SUB'):
+            constants.pop('a', None)
+        elif operation == 'GET':
+            self.set('a', constants.get(reg))
+        elif operation == 'PUT':
+            self.set(reg, constants.get('a'))
+        elif operation == 'RST':
+            constants[reg] = 0
+        elif operation in ('INC', 'DEC', 'SHL', 'SHR') and reg in constants:
+            value = constants[reg]
+            if operation == 'INC':
+                constants[reg] = value + 1
+            elif operation == 'DEC':
+                constants[reg] = max(0, value - 1)
+            elif operation == 'SHL':
+                constants[reg] = value * 2
+            else: # operation == 'SHR'
+                constants[reg] = value // 2
+        elif operation == 'STRK':
+            constants.pop(reg, None)
+        elif operation in ('STORE', 'WRITE'):
+            pass
+        else: # jumps, the instruction after one may be a jump target
+            self.forget()
+
+    def label(self):
+        self.labels.append(-1)
+        return len(self.labels) - 1
+
+    # the label marks the next instruction appended
+    def place(self, label):
+        self.labels[label] = len(self)
+
+    # removes the instructions from start on, labels placed there must not be jumped to
+    def truncate(self, start):
+        del self.opcodes[start:]
+        del self.arguments[start:]
+        del self.origins[start:]
+
+    # [(operation, argument)] with registers by name, jumps by address and None without an argument
+    def program(self):
+        program = []
+        labels = self.labels
+        for opcode, argument in zip(self.opcodes, self.arguments):
+            operation = operations[opcode]
+            if argument < 0:
+                program.append((operation, None))
+            elif operation in jumps:
+                if labels[argument] < 0:
+                    raise Exception(f'jump to label {argument} that was never placed')
+                program.append((operation, labels[argument]))
+            else:
+                program.append((operation, registers[argument]))
+        return program
+
+    def set(self, reg, value):
+        if value is None:
+            self.constants.pop(reg, None)
+        else:
+            self.constants[reg] = value
+
+    # has to be called at every position that is a jump target
+    def forget(self):
+        self.constants.clear()
+
+# lines of the output file
+def listing(program):
+    return [operation if argument is None else f'{operation} {argument}' for operation, argument in program]
+
+class Generator:
+    # registers that may hold variables for the lifetime of a loop, in order of preference
+    spare_registers = ['e', 'd', 'c', 'b']
+    # largest step of an index whose element addresses are kept up to date with INCs
+    max_address_step = 4
+    # number -> result of multiplication_plan, shared between compilations
+    multiplication_plans = dict()
+
+    # profile is {source line: times executed} from a run of an earlier compilation, see profiling.py
+    def __init__(self, profile = None):
         self.debug = True
-        self.offset = 0
+        self.profile = profile
         self.memory = None
         self.procedures = dict()
-        self.code = []
+        # procedure name -> pairs of parameter positions that may be given the same variable
+        self.aliased = dict()
+        self.code = Code()
+        # label of main, None while there are no procedures
+        self.main = None
         self.errorMode = False
         self.loopDepth = 0
         self.lineno = 1
+        # variable name -> (register, written in loop)
+        self.registers = dict()
+        # (first, second, operation) of divisions whose result is kept in a temporary cell
+        self.available = set()
+        self.divisions = set()
+        self.division_temporaries = dict()
+        # block -> saved division results available at its start
+        self.block_divisions = dict()
+        # block -> variables loaded to registers at its end / written back at its start
+        self.allocations = dict()
+        self.releases = dict()
+        # block -> (array, index variable, register) of addresses kept in registers from its end / dropped at its start
+        self.address_allocations = dict()
+        self.address_releases = dict()
+        # (array, index variable) -> register holding the address of the element
+        self.addresses = dict()
+        # parameters of the function being lowered and the names of those passed by value
+        self.parameters = []
+        self.by_value = set()
+        self.passes = PassManager()
+        self.passes.register('bypass empty blocks', bypass_empty_blocks)
+        self.passes.register('parameters by value', self.pass_by_value)
+        self.passes.register('loop invariants', self.hoist_invariants)
+        self.inliner = Inliner(profile)
+        # phase -> seconds, procedure name -> seconds
+        self.timings = dict()
+        self.procedure_timings = dict()
+
+    def gen_program(self, procedures, main):
+        self.inliner.count_calls(procedures, main[1])
+        self.aliased = self.aliased_parameters(procedures, main[1])
+        for procedure in procedures:
+            self.gen_procedure(*procedure)
+        self.gen(*main)
 
     def gen_procedure(self, head, declarations, commands):
         name = head[0]
@@ -140,38 +340,67 @@ class Generator:
         if name in self.procedures:
             print(f'Error: Line {head[2]}: procedure {name} already declared')
             return
-        if len(self.code) == 0:
-            self.code.append('PLACEHOLDER')
-        procedure = Procedure(name, len(self.code), self.offset)
-        self.memory = Memory(self.offset + 1)
+        start = time.perf_counter()
+        # procedures come first, the program starts with a jump to main
+        if self.main is None:
+            self.main = self.code.label()
+            self.code.append('JUMP', self.main)
+        self.code.forget()
+        procedure = Procedure(name, self.code.label(), 0)
+        self.code.place(procedure.location)
+        self.memory = Memory(1)
 
         # gen pointers
         for arg in args:
             self.memory.add_pointer(arg[1], arg[0])
-            procedure.add_pointer(self.memory.get_variable(arg[1]), arg[0])
         
         self.gen_declarations(declarations)
-        self.gen_body(commands)
+        commands, declared = self.inline(commands)
+        self.parameters = args
+        function = self.lower(name, commands)
+        by_value = self.by_value
+        # the return address is kept in the first cell of the frame
+        procedure.callees = self.callees(function)
+        procedure.callback = self.frame_start(procedure.callees)
+        self.memory.start = procedure.callback + 1
+        self.gen_function(function)
+        procedure.end = self.memory.offset
+        # locations are known once the memory is arranged
+        for arg in args:
+            procedure.add_pointer(self.memory.get_variable(arg[1]), arg[0], arg[1] in by_value)
+        if not self.errorMode:
+            locals = [(declaration[1], declaration[2] if declaration[0] == 'array' else None) for declaration in declarations]
+            procedure.body = (args, locals + declared, commands)
+            procedure.size = command_count(commands)
         self.procedures.setdefault(name, procedure)
-        self.offset = self.memory.offset
 
         # return
+        self.code.origin = (head[2], 'return')
         self.gen_number(procedure.callback, 'a')
-        self.code.append('LOAD a')
-        self.code.append('INC a')
-        self.code.append('INC a')
-        self.code.append('INC a')
-        self.code.append('JUMPR a')
+        self.code.append('LOAD', 'a')
+        self.code.append('INC', 'a')
+        self.code.append('INC', 'a')
+        self.code.append('INC', 'a')
+        self.code.append('JUMPR', 'a')
+        self.procedure_timings[name] = time.perf_counter() - start
 
     def gen(self, declarations, commands):
-        if len(self.code) > 0:
-            self.code[0] = f'JUMP {len(self.code)}'
+        if self.main is not None:
+            self.code.place(self.main)
         # for procedure in self.procedures:
             # print(procedure)
-        self.memory = Memory(self.offset)
+        start = time.perf_counter()
+        self.code.forget()
+        self.memory = Memory(0)
         self.gen_declarations(declarations)
-        self.gen_body(commands)
-        self.code.append("HALT")
+        commands, declared = self.inline(commands)
+        self.parameters = []
+        function = self.lower('main', commands)
+        self.memory.start = self.frame_start(self.callees(function))
+        self.gen_function(function)
+        self.code.origin = (None, 'halt')
+        self.code.append('HALT')
+        self.procedure_timings['main'] = time.perf_counter() - start
 
     def gen_declarations(self, declarations):
         for declaration in declarations:
@@ -190,302 +419,524 @@ class Generator:
         # for name, entry in self.memory.items():
             # print(f'Name: {name}, {entry}')
 
-    def gen_body(self, commands):
-        for command in commands:
-            # print(f"Generating command: {command}")
-            if command[0] == 'assign':
-                target = command[1]
-                expression = command[2]
-                primary_reg = 'h'
-                self.lineno = command[3]
-                try:
-                    self.load_address(target, primary_reg)
-                    self.calculate_expression(expression, command[3])
-                    self.code.append(f'STORE {primary_reg}')
-                except Exception as e:
-                    print(f'Error: Line {command[3]}: {e}')
-                    self.errorMode = True
+    # calls replaced by procedure bodies, with their local variables declared
+    def inline(self, commands):
+        if self.errorMode:
+            return commands, []
+        start = time.perf_counter()
+        commands, declared = self.inliner.run(commands, self.procedures, self.memory)
+        self.timed('inlining', start)
+        for name, size in declared:
+            if size is None:
+                self.memory.add_variable(name)
+                # checked when the procedure was generated
+                self.memory[name].initialized = True
+            else:
+                self.memory.add_array(name, size)
+        return commands, declared
+
+    # procedures a function may call, directly or through other procedures
+    def callees(self, function):
+        callees = set()
+        for block in function.live_blocks():
+            for instruction in block.instructions:
+                if isinstance(instruction, Call) and instruction.name in self.procedures:
+                    callees.add(instruction.name)
+                    callees.update(self.procedures[instruction.name].callees)
+        return callees
+
+    # there is no recursion, so a frame only has to follow the frames of the procedures it may call
+    # frames of procedures that are never active together overlap
+    def frame_start(self, callees):
+        return max((self.procedures[name].end for name in callees), default=0)
+
+    # control flow graph of commands, after the passes
+    def lower(self, name, commands):
+        start = time.perf_counter()
+        commands = ConstantPropagation(self.memory, self.procedures).run(commands)
+        start = self.timed('constant propagation', start)
+        function = Builder().build(name, commands)
+        start = self.timed('control flow graph', start)
+        function = self.passes.run(function, self.memory)
+        self.timed('graph passes', start)
+        return function
+
+    # adds the time since start to a phase, returns the current time
+    def timed(self, phase, start):
+        now = time.perf_counter()
+        self.timings[phase] = self.timings.get(phase, 0) + now - start
+        return now
+
+    # emits blocks in layout order, jumps go to the labels of the blocks
+    def gen_function(self, function):
+        start = time.perf_counter()
+        self.reset_divisions(function)
+        self.allocate_registers(function)
+        self.arrange_memory(function)
+        start = self.timed('register allocation', start)
+        blocks = function.live_blocks()
+        # block -> the block emitted after it, None is the end of the function
+        next_blocks = dict(zip(blocks, blocks[1:] + [None]))
+        # block -> label of its first instruction, None is the end of the function
+        self.block_labels = {None: self.code.label()}
+        previous = None
+        for block in function.blocks:
+            if block.unreachable:
+                self.discard(block)
+                continue
+            next_block = next_blocks[block]
+            self.code.place(self.block_label(block))
+            # values in registers are only known when the block can be entered from the previous one alone
+            if block.predecessors != [previous]:
+                self.code.forget()
+            self.loopDepth = block.depth
+            self.available = self.block_divisions[block]
+            self.code.origin = (None, 'registers')
+            self.release_registers(self.releases.get(block, []))
+            self.release_addresses(self.address_releases.get(block, []))
+            for instruction in block.instructions:
+                self.gen_instruction(instruction)
+            self.code.origin = (None, 'registers')
+            self.load_registers(self.allocations.get(block, []))
+            self.load_addresses(self.address_allocations.get(block, []))
+            self.gen_terminator(block.terminator, next_block)
+            previous = block
+        self.loopDepth = 0
+        self.code.place(self.block_labels[None])
+        self.timed('instruction selection', start)
+
+    def gen_terminator(self, terminator, next_block):
+        if isinstance(terminator, Jump):
+            self.code.origin = (None, 'jump')
+            if terminator.target is not next_block:
+                self.gen_jump('JUMP', terminator.target)
+
+        elif isinstance(terminator, Branch):
+            self.code.origin = (terminator.lineno, 'condition')
+            (condition, swap) = self.simplify_condition(terminator.condition)
+            if not swap:
+                taken = terminator.true_block
+                other = terminator.false_block
+            else:
+                taken = terminator.false_block
+                other = terminator.true_block
 
-                self.initialize(target)
-            
-            elif command[0] == 'write':
-                target = command[1]
-                if target[0] == 'number':
-                    self.gen_number(target[1])
-                    self.code.append('WRITE')
-                else: # target[0] == 'load'
-                    self.lineno = command[2]
-                    primary_reg = 'h'
-                    try:
-                        self.load_address(target[1], primary_reg)
-                        self.code.append(f'LOAD {primary_reg}')
-                        self.code.append('WRITE')
-                    except Exception as e:
-                        print(f'Error: Line {command[2]}: {e}')
-                        self.errorMode = True
+            # the condition ends with a jump to taken when it holds
+            if terminator.repeated:
+                with redirect_stdout(io.StringIO()):
+                    self.generate_condition(condition, self.block_label(taken))
+            else:
+                self.generate_condition(condition, self.block_label(taken))
+            if other is not next_block:
+                self.gen_jump('JUMP', other)
+
+        else: # isinstance(terminator, Exit)
+            self.code.origin = (None, 'jump')
+            if next_block is not None:
+                self.gen_jump('JUMP', None)
+
+    # jump to a block, None is the end of the function
+    def gen_jump(self, opcode, block):
+        self.code.append(opcode, self.block_label(block))
+
+    def block_label(self, block):
+        if block not in self.block_labels:
+            self.block_labels[block] = self.code.label()
+        return self.block_labels[block]
+
+    def gen_instruction(self, instruction):
+        self.code.origin = (getattr(instruction, 'lineno', None), instruction.__class__.__name__.lower())
+        if isinstance(instruction, Assign):
+            target = instruction.target
+            expression = instruction.expression()
+            primary_reg = 'h'
+            self.lineno = instruction.lineno
+            try:
+                cached_reg = self.cached_register(target)
+                if cached_reg is None:
+                    address_reg = self.load_address(target, primary_reg)
+                self.calculate_expression(expression, instruction.lineno)
+                if cached_reg is None:
+                    self.code.append('STORE', address_reg)
+                else:
+                    self.code.append('PUT', cached_reg)
+                self.save_other_result(instruction)
+            except Exception as e:
+                print(f'Error: Line {instruction.lineno}: {e}')
+                self.errorMode = True
 
-            elif command[0] == 'read':
-                target = command[1]
+            self.initialize(target)
+            self.available = self.transfer_divisions(instruction, self.available)
+            self.update_addresses(instruction)
+
+        elif isinstance(instruction, Write):
+            target = instruction.value
+            if target[0] == 'number':
+                self.gen_number(target[1])
+                self.code.append('WRITE')
+            else: # target[0] == 'load'
+                self.lineno = instruction.lineno
                 primary_reg = 'h'
-                self.lineno = command[2]
                 try:
-                    self.load_address(target, primary_reg)
-                    self.code.append('READ')
-                    self.code.append(f'STORE {primary_reg}')
+                    self.load_value(target[1], primary_reg)
+                    self.code.append('WRITE')
                 except Exception as e:
-                    print(f'Error Line: {command[2]}: {e}')
+                    print(f'Error: Line {instruction.lineno}: {e}')
                     self.errorMode = True
 
-                self.initialize(target)
-
-            elif command[0] == 'ifelse':
-                # TODO: optimize for numbers
-                condition = command[1]
-                # print(f'Condition: {condition}')
-                (condition, swap) = self.simplify_condition(condition)
-                # print(f'Simplified: {(condition, swap)}')
-
-                if not swap:
-                    block_a = command[2]
-                    block_b = command[3]
+        elif isinstance(instruction, Read):
+            target = instruction.target
+            primary_reg = 'h'
+            self.lineno = instruction.lineno
+            try:
+                cached_reg = self.cached_register(target)
+                if cached_reg is None:
+                    address_reg = self.load_address(target, primary_reg)
+                    self.code.append('READ')
+                    self.code.append('STORE', address_reg)
                 else:
-                    block_b = command[2]
-                    block_a = command[3]
-
-                # print(f'Block A: {block_a}')
-                # print(f'Block B: {block_b}')
-                
-                self.generate_condition(condition)
-
-                before_block_a = len(self.code)
-                self.code.append('JUMP to block_b')
+                    self.code.append('READ')
+                    self.code.append('PUT', cached_reg)
+            except Exception as e:
+                print(f'Error Line: {instruction.lineno}: {e}')
+                self.errorMode = True
 
-                self.gen_body(block_a)
+            self.initialize(target)
+            self.available = self.transfer_divisions(instruction, self.available)
+            self.update_addresses(instruction)
 
-                after_block_a = len(self.code)
-                self.code.append('JUMP to block_b_end')
+        elif isinstance(instruction, Initialize):
+            for name in instruction.names:
+                self.initialize((self.memory.get_type(name), name))
 
-                self.gen_body(block_b)
+        elif isinstance(instruction, Call):
+            name = instruction.name
+            args = instruction.args
+            lineno = instruction.lineno
 
-                after_block_b = len(self.code)
-                self.code[before_block_a] = f'JUMP {after_block_a + 1}'
-                self.code[after_block_a] = f'JUMP {after_block_b}'
+            for arg in args:
+                try:
+                    type = self.memory.get_type(arg)
+                    self.initialize((type, arg))
+                except:
+                    pass
 
-            elif command[0] == 'while':
-                # TODO: optimize for numbers
-                condition = command[1]
-                block = command[2]
-                # print(f'Condition: {condition}')
-                (condition, swap) = self.simplify_condition(condition)
-                # print(f'Simplified: {(condition, swap)}')
-                # print(f'Block: {block}')
-                
-                before_condition = len(self.code)
-                self.generate_condition(condition)
-
-                if not swap:
-                    before_block = len(self.code)
-                    self.code.append('JUMP to block end')
-                    self.loopDepth += 1
-                    self.gen_body(block)
-                    self.loopDepth -= 1
-                    self.code.append(f'JUMP {before_condition}')
-                    after_block = len(self.code)
-                    self.code[before_block] = f'JUMP {after_block}'
-                else: # swap
-                    before_block = len(self.code) - 1
-                    self.loopDepth += 1
-                    self.gen_body(block)
-                    self.loopDepth -= 1
-                    self.code.append(f'JUMP {before_condition}')
-                    after_block = len(self.code)
-                    if condition[0] == 'gt':
-                        self.code[before_block] = f'JPOS {after_block}'
-                    else: # condition[0] =='eq'
-                        self.code[before_block] = f'JZERO {after_block}'
-
-            elif command[0] == 'repeat':
-                # TODO: optimize for numbers
-                condition = command[1]
-                block = command[2]
-                # print(f'Condition: {condition}')
-                (condition, swap) = self.simplify_condition(condition)
-                # print(f'Simplified: {(condition, swap)}')
-                # print(f'Block: {block}')
-
-                block_start = len(self.code)
-                self.loopDepth += 1
-                self.gen_body(block)
-                self.loopDepth -= 1
+            if not name in self.procedures:
+                print(f'Error: Line {lineno}: procedure {name} not declared (this may mean that recursive call was issued)')
+                self.errorMode = True
+                return
+            procedure = self.procedures[name]
+            if len(args) != len(procedure.pointers):
+                print(f'Error: Line {lineno}: argument count mismatch with procedure {name} (received: {len(args)}, expected: {len(procedure.pointers)})')
+                self.errorMode = True
+                return
+            self.spill_registers()
+            for i in range(len(args)):
+                type = self.memory.get_type(args[i])
+                if type == 'pointer':
+                    type = self.memory.get_pointer_type(args[i])
                 
-                self.generate_condition(condition)
-                if not swap:
-                    self.code.append(f'JUMP {block_start}')
-                else: # swap
-                    last_jump = len(self.code) - 1
-                    if condition[0] == 'gt':
-                        self.code[last_jump] = (f'JPOS {block_start}')
-                    else: # condition[0] = 'eq'
-                        self.code[last_jump] = (f'JZERO {block_start}')
-
-            elif command[0] == 'call':
-                name = command[1][0]
-                args = command[1][1]
-                lineno = command[1][2]
-
-                for arg in args:
-                    try:
-                        type = self.memory.get_type(arg)
-                        self.initialize((type, arg))
-                    except:
-                        pass
-
-                if not name in self.procedures:
-                    print(f'Error: Line {lineno}: procedure {name} not declared (this may mean that recursive call was issued)')
+                if type != procedure.pointers[i].type:
+                    print(f'Error: Line {lineno}: argument type mismatch with procedure {name}')
                     self.errorMode = True
                     continue
-                procedure = self.procedures[name]
-                if len(args) != len(procedure.pointers):
-                    print(f'Error: Line {lineno}: argument count mismatch with procedure {name} (received: {len(args)}, expected: {len(procedure.pointers)})')
-                    self.errorMode = True
-                    continue
-                for i in range(len(args)):
-                    type = self.memory.get_type(args[i])
-                    if type == 'pointer':
-                        type = self.memory.get_pointer_type(args[i])
-                    
-                    if type != procedure.pointers[i].type:
-                        print(f'Error: Line {lineno}: argument type mismatch with procedure {name}')
-                        self.errorMode = True
-                        continue
-                    
+                
+                if procedure.pointers[i].by_value:
+                    self.load_value((type, args[i]), 'h')
+                else:
                     # fix assigning pointer arrays
                     if type == 'variable':
-                        self.load_address((type, args[i]), 'h')
+                        address_reg = self.load_address((type, args[i]), 'h')
                     else: # type == 'array'
-                        self.load_address((type, args[i], ('number', 0)), 'h')
-
-                    self.code.append('GET h')
-                    self.gen_number(procedure.pointers[i].location, 'b')
-                    self.code.append('STORE b')
-                
-                # saving location for return
-                self.gen_number(procedure.callback, 'b')
-                self.code.append('STRK a')
-                self.code.append('STORE b')
-                self.code.append(f'JUMP {procedure.location}')
+                        address_reg = self.load_address((type, args[i], ('number', 0)), 'h')
+                    self.code.append('GET', address_reg)
+                # g is never a spare register, those may still hold values and addresses of the next arguments
+                self.gen_number(procedure.pointers[i].location, 'g')
+                self.code.append('STORE', 'g')
+            
+            # saving location for return
+            self.gen_number(procedure.callback, 'b')
+            self.code.append('STRK', 'a')
+            self.code.append('STORE', 'b')
+            self.code.append('JUMP', procedure.location)
+            self.restore_registers()
+            self.available = self.transfer_divisions(instruction, self.available)
+
+    # code removed at compile time is generated only to report the same errors
+    def discard(self, block):
+        start = len(self.code)
+        constants = dict(self.code.constants)
+        self.loopDepth = block.depth
+        self.available = set()
+        for instruction in block.instructions:
+            self.gen_instruction(instruction)
+        self.code.truncate(start)
+        self.code.constants = constants
 
     def perform_mulitplication(self, second_reg = 'b', third_reg = 'c', fourth_reg = 'd'):
-        self.code.append(f'RST {second_reg}')
+        loop = self.code.label()
+        shift = self.code.label()
+        done = self.code.label()
+        self.code.append('RST', second_reg)
         # multiply
-        self.code.append(f'GET {fourth_reg}')
-        k = len(self.code)
-        self.code.append(f'JZERO {k + 11}')
-        self.code.append(f'SHR {fourth_reg}')
-        self.code.append(f'SHL {fourth_reg}')
-        self.code.append(f'SUB {fourth_reg}')
-        k = len(self.code)
-        self.code.append(f'JZERO {k + 4}')
-        self.code.append(f'GET {second_reg}')
-        self.code.append(f'ADD {third_reg}')
-        self.code.append(f'PUT {second_reg}')
+        self.code.place(loop)
+        self.code.append('GET', fourth_reg)
+        self.code.append('JZERO', done)
+        self.code.append('SHR', fourth_reg)
+        self.code.append('SHL', fourth_reg)
+        self.code.append('SUB', fourth_reg)
+        self.code.append('JZERO', shift)
+        self.code.append('GET', second_reg)
+        self.code.append('ADD', third_reg)
+        self.code.append('PUT', second_reg)
         # shift
-        self.code.append(f'SHL {third_reg}')
-        self.code.append(f'SHR {fourth_reg}')
-        k = len(self.code)
-        self.code.append(f'JUMP {k - 11}')
+        self.code.place(shift)
+        self.code.append('SHL', third_reg)
+        self.code.append('SHR', fourth_reg)
+        self.code.append('JUMP', loop)
         # done
-        self.code.append(f'GET {second_reg}')
+        self.code.place(done)
+        self.code.append('GET', second_reg)
 
-    def perform_division(self, result = 'b', counter = 'c', partial = 'd', remainder = 'e', divisor = 'f'):
-        self.code.append(f'RST {result}')
+    # a = memory_cell * number, value_reg keeps the value of memory_cell, temp_reg holds partial results
+    def multiply_by_constant(self, memory_cell, number, value_reg, temp_reg = 'b'):
+        if number == 0:
+            self.code.append('RST', 'a')
+            return
+        cached = self.cached_register(memory_cell) is not None
+        value_reg = self.load_register(memory_cell, value_reg)
+        cost, digits, factors = self.multiplication_plan(number)
+
+        if cached:
+            self.code.append('GET', value_reg)
+        for digit in digits[1:]:
+            self.code.append('SHL', 'a')
+            if digit == 1:
+                self.code.append('ADD', value_reg)
+            elif digit == -1:
+                self.code.append('SUB', value_reg)
+        # multiply by factors of form 2^k + 1 or 2^k - 1
+        for shift, sign in factors:
+            self.code.append('PUT', temp_reg)
+            for _ in range(shift):
+                self.code.append('SHL', 'a')
+            self.code.append('ADD' if sign == 1 else 'SUB', temp_reg)
+
+    # cheapest way of multiplying by number: (cost, signed digits of the first factor, [(shift, sign)] of the others)
+    def multiplication_plan(self, number):
+        plans = self.multiplication_plans
+        if number in plans:
+            return plans[number]
+        best = None
+        for digits in (self.binary_digits(number), self.signed_digits(number)):
+            cost = len(digits) - 1 + 5 * (len(digits) - digits.count(0) - 1)
+            if best is None or cost < best[0]:
+                best = (cost, digits, [])
+
+        for shift in range(2, number.bit_length()):
+            for sign in (1, -1):
+                factor = (1 << shift) + sign
+                if number % factor == 0:
+                    cost, digits, factors = self.multiplication_plan(number // factor)
+                    cost += shift + 6
+                    if cost < best[0]:
+                        best = (cost, digits, factors + [(shift, sign)])
+        plans[number] = best
+        return best
+
+    # most significant digit first
+    def binary_digits(self, number):
+        return [int(bit) for bit in bin(number)[2:]]
+
+    # non-adjacent form, no two consecutive digits are non-zero and every prefix is positive
+    def signed_digits(self, number):
+        digits = []
+        while number > 0:
+            if number % 2 == 1:
+                digit = 2 - number % 4
+                number -= digit
+            else:
+                digit = 0
+            digits.append(digit)
+            number //= 2
+        return digits[::-1]
+
+    # a = memory_cell / number or memory_cell % number, division by 0 gives 0
+    def divide_by_constant(self, memory_cell, number, operation, value_reg, result = 'b', counter = 'c', partial = 'd'):
+        if number == 0 or (number == 1 and operation == 'mod'):
+            self.code.append('RST', 'a')
+            return
+
+        # powers of two are shifted out
+        if number & (number - 1) == 0:
+            shift = number.bit_length() - 1
+            if operation == 'div':
+                self.load_value(memory_cell, value_reg)
+                for _ in range(shift):
+                    self.code.append('SHR', 'a')
+            else: # operation == 'mod'
+                cached = self.cached_register(memory_cell) is not None
+                value_reg = self.load_register(memory_cell, value_reg)
+                if cached:
+                    self.code.append('GET', value_reg)
+                for _ in range(shift):
+                    self.code.append('SHR', 'a')
+                for _ in range(shift):
+                    self.code.append('SHL', 'a')
+                self.code.append('PUT', result)
+                self.code.append('GET', value_reg)
+                self.code.append('SUB', result)
+            return
 
-        # cannot divide by zero
-        self.code.append(f'GET {divisor}')
-        k = len(self.code)
-        self.code.append(f'JPOS {k + 2}')
-        k = len(self.code)
-        self.code.append(f'JUMP {k + 22}')
+        remainder = self.load_register(memory_cell, value_reg, True)
+        self.perform_constant_division(number, result, counter, partial, remainder)
+        if operation == 'div':
+            self.code.append('GET', result)
+        else: # operation == 'mod'
+            self.code.append('GET', remainder)
+
+    # long division by a non-zero constant, quotient goes to result and remainder stays in remainder
+    def perform_constant_division(self, number, result, counter, partial, remainder):
+        self.code.append('RST', result)
+        self.code.append('RST', counter)
+        self.gen_number(number, partial)
+
+        scale_up = self.code.label()
+        scale_down = self.code.label()
+        end = self.code.label()
+
+        # shift partial left until it exceeds remainder
+        self.code.place(scale_up)
+        self.code.forget()
+        self.code.append('GET', partial)
+        self.code.append('SUB', remainder)
+        self.code.append('JPOS', scale_down)
+        self.code.append('SHL', partial)
+        self.code.append('INC', counter)
+        self.code.append('JUMP', scale_up)
+
+        # shift it back, subtracting it whenever possible
+        self.code.place(scale_down)
+        self.code.append('GET', counter)
+        self.code.append('JZERO', end)
+        self.code.append('DEC', counter)
+        self.code.append('SHR', partial)
+        self.code.append('SHL', result)
+        self.code.append('GET', partial)
+        self.code.append('SUB', remainder)
+        self.code.append('JPOS', scale_down)
+        self.code.append('GET', remainder)
+        self.code.append('SUB', partial)
+        self.code.append('PUT', remainder)
+        self.code.append('INC', result)
+        self.code.append('JUMP', scale_down)
+        self.code.place(end)
+
+    def perform_division(self, result = 'b', counter = 'c', partial = 'd', remainder = 'e', divisor = 'f'):
+        check = self.code.label()
+        scale_up = self.code.label()
+        subtract = self.code.label()
+        done = self.code.label()
+        self.code.append('RST', result)
+
+        # cannot divide by zero, the quotient and the remainder are both 0
+        self.code.append('GET', divisor)
+        self.code.append('JPOS', check)
+        self.code.append('RST', remainder)
+        self.code.append('JUMP', done)
 
         # check exit condition
-        self.code.append(f'GET {divisor}')
-        self.code.append(f'SUB {remainder}')
-        k = len(self.code)
-        self.code.append(f'JPOS {k + 19}')
+        self.code.place(check)
+        self.code.append('GET', divisor)
+        self.code.append('SUB', remainder)
+        self.code.append('JPOS', done)
 
         # setup
-        self.code.append(f'RST {counter}')
-        self.code.append(f'INC {counter}')
-        self.code.append(f'GET {divisor}')
-        self.code.append(f'PUT {partial}')
+        self.code.append('RST', counter)
+        self.code.append('INC', counter)
+        self.code.append('GET', divisor)
+        self.code.append('PUT', partial)
         # loop start
-        self.code.append(f'SHL {partial}')
+        self.code.place(scale_up)
+        self.code.append('SHL', partial)
 
         # check for end loop
-        self.code.append(f'GET {partial}')
-        self.code.append(f'SUB {remainder}')
-        k = len(self.code)
-        self.code.append(f'JPOS {k + 3}')
+        self.code.append('GET', partial)
+        self.code.append('SUB', remainder)
+        self.code.append('JPOS', subtract)
 
-        self.code.append(f'SHL {counter}')
-        k = len(self.code)
-        self.code.append(f'JUMP {k - 5}')
+        self.code.append('SHL', counter)
+        self.code.append('JUMP', scale_up)
 
         # end loop
-        self.code.append(f'SHR {partial}')
-        self.code.append(f'GET {remainder}')
-        self.code.append(f'SUB {partial}')
-        self.code.append(f'PUT {remainder}')
-        self.code.append(f'GET {result}')
-        self.code.append(f'ADD {counter}')
-        self.code.append(f'PUT {result}')
-        k = len(self.code)
-        self.code.append(f'JUMP {k - 20}')
-
-
-    def generate_condition(self, condition):
+        self.code.place(subtract)
+        self.code.append('SHR', partial)
+        self.code.append('GET', remainder)
+        self.code.append('SUB', partial)
+        self.code.append('PUT', remainder)
+        self.code.append('GET', result)
+        self.code.append('ADD', counter)
+        self.code.append('PUT', result)
+        self.code.append('JUMP', check)
+        self.code.place(done)
+
+
+    # jumps to target when the condition holds
+    def generate_condition(self, condition, target):
         operator = condition[0]
         first_value = condition[1]
         second_value = condition[2]
 
-        # first value goes to e
-        first_value_reg = 'e'
-        # second value goes to f
-        second_value_reg = 'f'
+        # comparisons with zero jump on the value itself
+        value = self.zero_compared(condition)
+        if value is not None:
+            if value[0] == 'number':
+                self.gen_number(value[1], 'a')
+            else: # value[0] == 'load'
+                self.load_value(value[1], 'f')
+            self.code.append('JPOS' if operator == 'gt' else 'JZERO', target)
+            return
+
+        # first value goes to f
+        first_value_reg = 'f'
+        # second value goes to g
+        second_value_reg = 'g'
 
         third_reg = 'b'
 
         if first_value[0] == 'number':
             self.gen_number(first_value[1], first_value_reg)
         else: #first_value[0] == 'load'
-            self.load_address(first_value[1], first_value_reg)
-            self.code.append(f'LOAD {first_value_reg}')
-            self.code.append(f'PUT {first_value_reg}')
+            first_value_reg = self.load_register(first_value[1], first_value_reg)
         
         if second_value[0] == 'number':
             self.gen_number(second_value[1], second_value_reg)
         else: #second_value[0] == 'load'
-            self.load_address(second_value[1], second_value_reg)
-            self.code.append(f'LOAD {second_value_reg}')
-            self.code.append(f'PUT {second_value_reg}')
+            second_value_reg = self.load_register(second_value[1], second_value_reg)
         
         if operator == 'gt':
-            self.code.append(f'GET {first_value_reg}')
-            self.code.append(f'SUB {second_value_reg}')
-            k = len(self.code)
-            self.code.append(f'JPOS {k + 2}')
+            self.code.append('GET', first_value_reg)
+            self.code.append('SUB', second_value_reg)
+            self.code.append('JPOS', target)
         
         else: # operator == 'eq'
-            self.code.append(f'GET {first_value_reg}')
-            self.code.append(f'SUB {second_value_reg}')
-            self.code.append(f'PUT {third_reg}')
-            self.code.append(f'GET {second_value_reg}')
-            self.code.append(f'SUB {first_value_reg}')
-            self.code.append(f'ADD {third_reg}')
-            k = len(self.code)
-            self.code.append(f'JZERO {k + 2}')
+            self.code.append('GET', first_value_reg)
+            self.code.append('SUB', second_value_reg)
+            self.code.append('PUT', third_reg)
+            self.code.append('GET', second_value_reg)
+            self.code.append('SUB', first_value_reg)
+            self.code.append('ADD', third_reg)
+            self.code.append('JZERO', target)
             
 
+    # value of a simplified condition x = 0, 0 = x or x > 0, None for other conditions
+    def zero_compared(self, condition):
+        if condition[2] == ('number', 0):
+            return condition[1]
+        if condition[0] == 'eq' and condition[1] == ('number', 0):
+            return condition[2]
+        return None
+
     def simplify_condition(self, condition):
         operator = condition[0]
         first_value = condition[1]
@@ -519,8 +970,7 @@ class Generator:
 
         elif expression[0] == "load":
             primary_reg = 'f';
-            self.load_address(expression[1], primary_reg)
-            self.code.append(f'LOAD {primary_reg}')
+            self.load_value(expression[1], primary_reg)
         
         # double argument expressions:
         else:
@@ -542,6 +992,13 @@ class Generator:
                 else:
                     print(f'Warning: Line {lineno}: variable {second_arg[1][1]} may be not initialized')
 
+            # result saved by an earlier division of the same values
+            key = self.division_key(expression)
+            if key in self.available:
+                self.gen_number(self.division_temporaries[key], 'f')
+                self.code.append('LOAD', 'f')
+                return
+
             # two numbers
             if first_arg[0] == 'number' and second_arg[0] == 'number':
                 if operation == 'add':
@@ -550,6 +1007,8 @@ class Generator:
                     result = max(0, first_arg[1] - second_arg[1])
                 elif operation == 'mul':
                     result = first_arg[1] * second_arg[1]
+                elif second_arg[1] == 0:
+                    result = 0
                 elif operation == 'div':
                     result = first_arg[1] // second_arg[1]
                 else: # operation == 'mod:
@@ -572,81 +1031,104 @@ class Generator:
 
                         # efficient decrement
                         if num_arg[1] == 1 and operation == 'sub':
-                            self.load_address(var_arg[1], first_value_reg)
-                            self.code.append(f'LOAD {first_value_reg}')
-                            self.code.append('DEC a')
+                            self.load_value(var_arg[1], first_value_reg)
+                            self.code.append('DEC', 'a')
                             return
                         
-                        # efficient division by 2
-                        if num_arg[1] == 2 and operation == 'div':
-                            self.load_address(var_arg[1], first_value_reg)
-                            self.code.append(f'LOAD {first_value_reg}')
-                            self.code.append('SHR a')
+                        # division by a constant without the generic division loop
+                        if operation == 'div' or operation == 'mod':
+                            self.divide_by_constant(var_arg[1], num_arg[1], operation, first_value_reg)
                             return
                     
                     # efficient increment
                     if num_arg[1] == 1 and operation == 'add':
-                        self.load_address(var_arg[1], first_value_reg)
-                        self.code.append(f'LOAD {first_value_reg}')
-                        self.code.append('INC a')
+                        self.load_value(var_arg[1], first_value_reg)
+                        self.code.append('INC', 'a')
                         return
                     
-                    # efficient multiplication by 2
-                    if num_arg[1] == 2 and operation == 'mul':
-                        self.load_address(var_arg[1], first_value_reg)
-                        self.code.append(f'LOAD {first_value_reg}')
-                        self.code.append('SHL a')
+                    # multiplication by a constant as a chain of shifts and additions
+                    if operation == 'mul':
+                        self.multiply_by_constant(var_arg[1], num_arg[1], first_value_reg)
                         return
 
+                # multiplication and division modify their operands, so cached values are copied
+                copy = operation in ('mul', 'div', 'mod')
+
                 # load first value
                 if first_arg[0] == 'number':
                     self.gen_number(first_arg[1], first_value_reg)
                 else: #first_arg[0] == 'load'
-                    self.load_address(first_arg[1], first_value_reg)
-                    self.code.append(f'LOAD {first_value_reg}')
-                    self.code.append(f'PUT {first_value_reg}')
+                    first_value_reg = self.load_register(first_arg[1], first_value_reg, copy)
 
                 # load second value
                 if second_arg[0] == 'number':
                     self.gen_number(second_arg[1], second_value_reg)
                 else: #second_arg[0] == 'load'
-                    self.load_address(second_arg[1], second_value_reg)
-                    self.code.append(f'LOAD {second_value_reg}')
-                    self.code.append(f'PUT {second_value_reg}')
+                    second_value_reg = self.load_register(second_arg[1], second_value_reg, copy)
 
                 if operation == 'add':
-                    self.code.append(f'GET {first_value_reg}')
-                    self.code.append(f'ADD {second_value_reg}')
+                    self.code.append('GET', first_value_reg)
+                    self.code.append('ADD', second_value_reg)
                 
                 elif operation == 'sub':
-                    self.code.append(f'GET {first_value_reg}')
-                    self.code.append(f'SUB {second_value_reg}')
+                    self.code.append('GET', first_value_reg)
+                    self.code.append('SUB', second_value_reg)
 
-                # TODO: optimize consts
                 elif operation == 'mul':
                     self.perform_mulitplication(third_reg=first_value_reg, fourth_reg=second_value_reg)
 
-                # TODO: optimize consts
                 else: # operation == 'div' or operation == 'mod'
                     secondary_reg = 'b'
                     self.perform_division(remainder=first_value_reg, divisor=second_value_reg)
 
                     if operation == 'div':
-                        self.code.append(f'GET {secondary_reg}')
+                        self.code.append('GET', secondary_reg)
                     else: # operation == 'mod'
-                        self.code.append(f'GET {first_value_reg}')
+                        self.code.append('GET', first_value_reg)
 
     def gen_number(self, number, reg = 'a'):
-        self.code.append(f'RST {reg}')
+        constants = self.code.constants
+        # reuse a value already held by a register, copying it with PUT or GET if needed
+        # (any register can be copied to a, other registers are only copied from a, as it may be in use)
+        best = self.number_cost(number) + 1
+        source = None
+        for candidate in (constants if reg == 'a' else (reg, 'a')):
+            if candidate in constants:
+                cost = abs(number - constants[candidate]) + (candidate != reg)
+                if cost < best:
+                    best = cost
+                    source = candidate
+        if source is not None:
+            if source != reg:
+                if reg != 'a':
+                    self.code.append('PUT', reg)
+                else:
+                    self.code.append('GET', source)
+            value = constants[reg]
+            while value < number:
+                self.code.append('INC', reg)
+                value += 1
+            while value > number:
+                self.code.append('DEC', reg)
+                value -= 1
+            return
+
+        self.code.append('RST', reg)
         if number == 0:
             return
         binary = bin(number)[2:]
         for bit in binary[:-1]:
             if bit == '1':
-                self.code.append(f'INC {reg}')
-            self.code.append(f'SHL {reg}')
+                self.code.append('INC', reg)
+            self.code.append('SHL', reg)
         if binary[-1] == '1':
-            self.code.append(f'INC {reg}')
+            self.code.append('INC', reg)
+
+    # instructions needed by gen_number after RST
+    def number_cost(self, number):
+        if number == 0:
+            return 0
+        return number.bit_length() - 1 + bin(number).count('1')
 
     # # will use a, if array[var]
     # def load_address(self, memory_cell, primary_reg):
@@ -663,16 +1145,20 @@ class Generator:
     #             address = self.memory.get_array_at_index(memory_cell[1], 0)
     #             secondary_address = self.memory.get_variable(index[1])
     #             self.gen_number(secondary_address, secondary_reg)
-    #             self.code.append(f'LOAD {secondary_reg}')
+    #             self.code.append('LOAD', secondary_reg)
     #             self.gen_number(address, primary_reg)
-    #             self.code.append(f'ADD {primary_reg}')
-    #             self.code.append(f'PUT {primary_reg}')
+    #             self.code.append('ADD', primary_reg)
+    #             self.code.append('PUT', primary_reg)
             
     # will use a, if array[var]
     # will use a, if pointers are used
+    # returns the register holding the address, primary_reg unless it is kept in another one
     def load_address(self, memory_cell, primary_reg):
         secondary_reg = 'a'
         if memory_cell[0] == 'variable':
+            # address of the variable behind a pointer kept in a register for the loop
+            if memory_cell[1] in self.registers and isinstance(self.memory[memory_cell[1]], Pointer) and self.memory.is_pointer(memory_cell[1]):
+                return self.registers[memory_cell[1]][0]
             address = self.memory.get_variable(memory_cell[1])
             self.gen_number(address, primary_reg)
 
@@ -681,8 +1167,8 @@ class Generator:
 
             # handling pointers
             if self.memory.is_pointer(memory_cell[1]):
-                self.code.append(f'LOAD {primary_reg}')
-                self.code.append(f'PUT {primary_reg}')
+                self.code.append('LOAD', primary_reg)
+                self.code.append('PUT', primary_reg)
 
         else: # memory_cell[0] == 'array'
             index = memory_cell[2]
@@ -696,65 +1182,101 @@ class Generator:
                     else:
                         print(f'Warning: Line {self.lineno}: variable {var} may be not initialized')
 
-            # handling pointers
-            if self.memory.is_array_pointer(memory_cell[1]):
-                address = self.memory.get_variable(memory_cell[1])
+            return self.element_address(memory_cell[1], index, primary_reg)
+        return primary_reg
 
-                if index[0] == 'number':
-                    self.gen_number(address, primary_reg)
-                    self.code.append(f'LOAD {primary_reg}')
-                    self.gen_number(index[1], primary_reg)
-                    self.code.append(f'ADD {primary_reg}')
-                    self.code.append(f'PUT {primary_reg}')
-
-                else: # index[0] == 'load'
-                    self.gen_number(address, primary_reg)
-                    self.code.append(f'LOAD {primary_reg}')
-                    self.code.append(f'PUT {primary_reg}')
-                    secondary_address = self.memory.get_variable(index[1])
-                    self.gen_number(secondary_address, 'a')
-
-                    # handling pointers... again
-                    if self.memory.is_pointer(index[1]):
-                        self.code.append(f'LOAD a')
-                        self.code.append(f'LOAD a')
-                        self.code.append(f'ADD {primary_reg}')
-                        self.code.append(f'PUT {primary_reg}')
-
-                    # handling non pointers
-                    else:
-                        self.code.append(f'LOAD a')
-                        self.code.append(f'ADD {primary_reg}')
-                        self.code.append(f'PUT {primary_reg}')
+    # address of array[index] in primary_reg, or the register that keeps it in a loop, which is returned
+    def element_address(self, array, index, primary_reg):
+        # address kept in a register that follows the index through the loop
+        if index[0] == 'load' and self.addresses.get((array, index[1]), primary_reg) != primary_reg:
+            return self.addresses[(array, index[1])]
 
+        # handling pointers
+        if self.memory.is_array_pointer(array):
+            address = self.memory.get_variable(array)
+            # address of the array kept in a register for the loop
+            base_reg = self.registers[array][0] if array in self.registers else None
 
-            # handling non pointers
-            else:
+            if base_reg is not None:
                 if index[0] == 'number':
-                    address = self.memory.get_array_at_index(memory_cell[1], index[1])
-                    self.gen_number(address, primary_reg)
+                    self.gen_number(index[1], primary_reg)
+                    self.code.append('GET', base_reg)
+                    self.code.append('ADD', primary_reg)
                 else: # index[0] == 'load'
-
-                    # once again handling pointers
-                    if self.memory.is_pointer(index[1]):
-                        address = self.memory.get_array_at_index(memory_cell[1], 0)
-                        secondary_address = self.memory.get_variable(index[1])
-                        self.gen_number(secondary_address, 'a')
-                        self.code.append(f'LOAD a')
-                        self.code.append(f'LOAD a')
-                        self.gen_number(address, primary_reg)
-                        self.code.append(f'ADD {primary_reg}')
-                        self.code.append(f'PUT {primary_reg}')
-
-
-                    else:
-                        address = self.memory.get_array_at_index(memory_cell[1], 0)
-                        secondary_address = self.memory.get_variable(index[1])
-                        self.gen_number(secondary_address, secondary_reg)
-                        self.code.append(f'LOAD {secondary_reg}')
-                        self.gen_number(address, primary_reg)
-                        self.code.append(f'ADD {primary_reg}')
-                        self.code.append(f'PUT {primary_reg}')
+                    self.load_index(index[1])
+                    self.code.append('ADD', base_reg)
+                self.code.append('PUT', primary_reg)
+
+            elif index[0] == 'number':
+                self.gen_number(address, primary_reg)
+                self.code.append('LOAD', primary_reg)
+                self.gen_number(index[1], primary_reg)
+                self.code.append('ADD', primary_reg)
+                self.code.append('PUT', primary_reg)
+
+            else: # index[0] == 'load'
+                self.gen_number(address, primary_reg)
+                self.code.append('LOAD', primary_reg)
+                self.code.append('PUT', primary_reg)
+                self.load_index(index[1])
+                self.code.append('ADD', primary_reg)
+                self.code.append('PUT', primary_reg)
+
+
+        # handling non pointers
+        else:
+            if index[0] == 'number':
+                address = self.memory.get_array_at_index(array, index[1])
+                self.gen_number(address, primary_reg)
+            else: # index[0] == 'load'
+                self.load_index(index[1])
+                address = self.memory.get_array_at_index(array, 0)
+                self.gen_number(address, primary_reg)
+                self.code.append('ADD', primary_reg)
+                self.code.append('PUT', primary_reg)
+        return primary_reg
+
+    # leaves value of an index variable in a
+    def load_index(self, name):
+        secondary_reg = 'a'
+        cached_reg = self.cached_register(('variable', name))
+        if cached_reg is not None:
+            self.code.append('GET', cached_reg)
+            return
+        secondary_address = self.memory.get_variable(name)
+        if name in self.registers and self.memory.is_pointer(name):
+            self.code.append('LOAD', self.registers[name][0])
+            return
+        self.gen_number(secondary_address, secondary_reg)
+        self.code.append('LOAD', secondary_reg)
+
+        # handling pointers
+        if self.memory.is_pointer(name):
+            self.code.append('LOAD', secondary_reg)
+
+    # leaves value of memory_cell in a
+    def load_value(self, memory_cell, primary_reg):
+        cached_reg = self.cached_register(memory_cell)
+        if cached_reg is not None:
+            self.code.append('GET', cached_reg)
+        else:
+            address_reg = self.load_address(memory_cell, primary_reg)
+            self.code.append('LOAD', address_reg)
+
+    # returns register holding value of memory_cell, primary_reg is used unless the value is cached
+    def load_register(self, memory_cell, primary_reg, copy = False):
+        cached_reg = self.cached_register(memory_cell)
+        if cached_reg is not None and not copy:
+            return cached_reg
+        self.load_value(memory_cell, primary_reg)
+        self.code.append('PUT', primary_reg)
+        return primary_reg
+
+    # array pointers may be in registers too, those hold the address of the array
+    def cached_register(self, memory_cell):
+        if memory_cell[0] == 'variable' and memory_cell[1] in self.registers and isinstance(self.memory[memory_cell[1]], Variable):
+            return self.registers[memory_cell[1]][0]
+        return None
 
     def initialize(self, target):
         if target[0] != 'variable':
@@ -773,3 +1295,510 @@ class Generator:
         if name in self.memory:
                     if isinstance(self.memory[name], Variable):
                         return not self.memory[name].initialized
+
+    # multiplications and divisions of scalars not written in a loop are computed once in its preheader
+    # inner loops go first, so that their invariants can leave the loops around them as well
+    def hoist_invariants(self, function, memory):
+        initialized = self.initialized_names(function)
+        hoisted = set()
+        for loop in reversed(function.loops):
+            blocks = [block for block in loop.blocks if not block.unreachable]
+            written = [target for block in blocks for instruction in block.instructions for target in self.written_identifiers(instruction)]
+            # expression -> variable holding it
+            names = dict()
+            for block in blocks:
+                instructions = []
+                for instruction in block.instructions:
+                    if not self.invariant(instruction, written, initialized[loop.preheader]):
+                        instructions.append(instruction)
+                        continue
+                    # invariants of an inner loop are moved as they are
+                    if instruction.target[0] == 'variable' and instruction.target[1] in hoisted:
+                        loop.preheader.instructions.append(instruction)
+                        continue
+                    expression = instruction.expression()
+                    if expression not in names:
+                        names[expression] = f'invariant {len(hoisted)}'
+                        hoisted.add(names[expression])
+                        memory.add_variable(names[expression])
+                        loop.preheader.instructions.append(Assign(('variable', names[expression]), instruction.operation, instruction.first, instruction.second, instruction.lineno))
+                    instructions.append(Assign(instruction.target, None, ('load', ('variable', names[expression])), None, instruction.lineno))
+                block.instructions = instructions
+
+    # preheader -> variables initialized before it is generated, only those can be read there without a warning
+    def initialized_names(self, function):
+        initialized = dict()
+        names = {name for name, entry in self.memory.items() if isinstance(entry, Variable) and entry.initialized}
+        preheaders = {loop.preheader for loop in function.loops}
+        for block in function.blocks:
+            for instruction in block.instructions:
+                if isinstance(instruction, Initialize):
+                    names.update(instruction.names)
+                else:
+                    names.update(identifier[1] for identifier in self.written_identifiers(instruction))
+            if block in preheaders:
+                initialized[block] = set(names)
+        return initialized
+
+    # identifiers an instruction may assign to
+    def written_identifiers(self, instruction):
+        if isinstance(instruction, (Assign, Read)):
+            return [instruction.target]
+        if isinstance(instruction, Call):
+            procedure = self.procedures.get(instruction.name)
+            return [('variable', arg) for position, arg in enumerate(instruction.args) if not passed_by_value(procedure, position)]
+        return []
+
+    # procedure name -> {(i, j)} of parameter positions i < j whose arguments may be the same variable at some call
+    # procedures only call the ones declared before them, so callers are visited before their callees
+    def aliased_parameters(self, procedures, main):
+        aliased = dict()
+        # positions is {parameter name: position} of the calling procedure, pairs are the positions that may be aliased
+        def visit(commands, positions, pairs):
+            for command in commands:
+                if command[0] == 'call':
+                    name, args, lineno = command[1]
+                    for i in range(len(args)):
+                        for j in range(i + 1, len(args)):
+                            first = positions.get(args[i])
+                            second = positions.get(args[j])
+                            if args[i] == args[j] or (first is not None and second is not None and (min(first, second), max(first, second)) in pairs):
+                                aliased.setdefault(name, set()).add((i, j))
+                elif command[0] == 'ifelse':
+                    visit(command[2], positions, pairs)
+                    visit(command[3], positions, pairs)
+                elif command[0] == 'while' or command[0] == 'repeat':
+                    visit(command[2], positions, pairs)
+        visit(main, dict(), set())
+        for head, declarations, commands in reversed(procedures):
+            visit(commands, {arg[1]: position for position, arg in enumerate(head[1])}, aliased.get(head[0], set()))
+        return aliased
+
+    # read-only scalar parameters are local variables holding the value of the argument
+    def pass_by_value(self, function, memory):
+        self.by_value = self.read_only_parameters(function.name, self.parameters, function)
+        for arg in self.parameters:
+            if arg[1] in self.by_value:
+                memory[arg[1]] = Variable(memory[arg[1]].location)
+                memory[arg[1]].initialized = True
+
+    # names of scalar parameters that neither the procedure nor the procedures it calls write
+    # a parameter that may refer to the same variable as a written one is not read-only either
+    def read_only_parameters(self, name, args, function):
+        written = set()
+        for block in function.blocks:
+            for instruction in block.instructions:
+                written.update(identifier[1] for identifier in self.written_identifiers(instruction))
+        positions = {position for position, arg in enumerate(args) if arg[1] in written}
+        aliased = self.aliased.get(name, set())
+        read_only = set()
+        for position, arg in enumerate(args):
+            if arg[0] != 'variable' or position in positions:
+                continue
+            if any((min(position, other), max(position, other)) in aliased for other in positions):
+                continue
+            read_only.add(arg[1])
+        return read_only
+
+    # an assignment of an expensive expression whose operands keep their values in the loop
+    def invariant(self, instruction, written, initialized):
+        if not isinstance(instruction, Assign) or not self.expensive(instruction.expression()):
+            return False
+        for value in (instruction.first, instruction.second):
+            if value[0] == 'number':
+                continue
+            if value[1][0] != 'variable' or not self.is_scalar(value[1][1]):
+                return False
+            name = value[1][1]
+            if any(self.writes(target, name) for target in written):
+                return False
+            if isinstance(self.memory[name], Variable) and name not in initialized:
+                return False
+        return True
+
+    # multiplications and divisions that run a loop of the generated code
+    def expensive(self, expression):
+        if expression[0] == 'mul':
+            return expression[1][0] == 'load' and expression[2][0] == 'load'
+        if expression[0] == 'div' or expression[0] == 'mod':
+            if expression[1][0] == 'number' and expression[2][0] == 'number':
+                return False
+            return expression[2][0] == 'load' or expression[2][1] & (expression[2][1] - 1) != 0
+        return False
+
+    # keeps the most used scalars and array addresses of every outermost loop in registers not modified inside of it
+    def allocate_registers(self, function):
+        self.allocations = dict()
+        self.releases = dict()
+        self.address_allocations = dict()
+        self.address_releases = dict()
+        for loop in function.loops:
+            if loop.depth > 0:
+                continue
+            uses = dict()
+            written = set()
+            clobbered = set()
+            for block in loop.blocks:
+                if block.unreachable:
+                    continue
+                weight = 10 ** (block.depth - loop.depth)
+                for instruction in block.instructions:
+                    self.count_uses(instruction, uses, written, self.weight(getattr(instruction, 'lineno', None), weight))
+                    clobbered.update(self.clobbered_registers(instruction))
+                if isinstance(block.terminator, Branch):
+                    condition = block.terminator.condition
+                    self.count_value(condition[1], uses, self.weight(block.terminator.lineno, weight))
+                    self.count_value(condition[2], uses, self.weight(block.terminator.lineno, weight))
+                    clobbered.update(self.condition_registers(condition))
+            free = [reg for reg in self.spare_registers if reg not in clobbered]
+            candidates = sorted([name for name in uses if uses[name] > 1], key=lambda name: -uses[name])
+
+            # registers of pointers hold addresses, which are never written back
+            allocated = [(name, reg, name in written and isinstance(self.memory[name], Variable)) for name, reg in zip(candidates, free)]
+            self.allocations[loop.preheader] = allocated
+            self.releases[loop.exit] = [name for name, reg, written in allocated]
+
+            # registers left over follow the addresses of array elements indexed by variables
+            addresses = self.count_addresses(loop)
+            candidates = sorted([key for key in addresses if addresses[key] > 0], key=lambda key: -addresses[key])
+            allocated = [(array, index, reg) for (array, index), reg in zip(candidates, free[len(allocated):])]
+            self.address_allocations[loop.preheader] = allocated
+            self.address_releases[loop.exit] = allocated
+
+    # the most accessed cells get the lowest addresses, which take the fewest instructions to build
+    # arrays are ordered by accesses per cell, so large ones go last
+    def arrange_memory(self, function):
+        # (name, weight) in the order of the code, None where the previous address is not known
+        accesses = []
+        # block -> variables kept in registers there, they are only accessed when loaded and written back
+        cached = dict()
+        for loop in function.loops:
+            allocated = self.allocations.get(loop.preheader, [])
+            for block in loop.blocks:
+                cached.setdefault(block, set()).update(name for name, reg, written in allocated)
+            for name, reg, written in allocated:
+                accesses.append((name, 10 ** loop.depth * (2 if written else 1)))
+            accesses.append((None, 0))
+        for block in function.live_blocks():
+            weight = 10 ** block.depth
+            skipped = cached.get(block, set())
+            for instruction in block.instructions:
+                accesses += [(name, self.weight(getattr(instruction, 'lineno', None), weight)) for name in self.accessed_names(instruction) if name not in skipped]
+            if isinstance(block.terminator, Branch):
+                accesses += [(name, self.weight(block.terminator.lineno, weight)) for name in self.value_names(block.terminator.condition[1:]) if name not in skipped]
+            accesses.append((None, 0))
+
+        totals = dict()
+        for name, weight in accesses:
+            totals[name] = totals.get(name, 0) + weight
+        def density(name):
+            entry = self.memory[name]
+            return totals.get(name, 0) / (entry.size if isinstance(entry, Array) else 1)
+        # declaration order breaks ties
+        names = sorted(self.memory, key=lambda name: (-density(name), self.memory[name].location))
+        # a division and a remainder may both be saved for every pair of values
+        temporaries = 2 * len(self.divisions)
+        # addresses are often built from a neighbouring one, so declaration order is kept unless the estimate is lower
+        declared = sorted(self.memory, key=lambda name: self.memory[name].location)
+        if self.layout_cost(accesses, self.memory.layout(names, temporaries)[0]) >= self.layout_cost(accesses, self.memory.layout(declared, temporaries)[0]):
+            names = declared
+        self.memory.arrange(names, temporaries)
+
+    # instructions building the addresses of the accesses, an address may be built from the previous one
+    def layout_cost(self, accesses, locations):
+        cost = 0
+        previous = None
+        for name, weight in accesses:
+            if name not in locations:
+                previous = None
+                continue
+            location = locations[name]
+            build = self.number_cost(location)
+            if previous is not None:
+                build = min(build, abs(location - previous))
+            cost += build * weight
+            previous = location
+        return cost
+
+    def accessed_names(self, instruction):
+        if isinstance(instruction, Call):
+            return list(instruction.args)
+        return [name for identifier in self.accessed_identifiers(instruction) for name in self.identifier_names(identifier)]
+
+    # identifiers written and read by an instruction other than a call
+    def accessed_identifiers(self, instruction):
+        if isinstance(instruction, Assign):
+            values = [instruction.first] if instruction.operation is None else [instruction.first, instruction.second]
+            return [instruction.target] + [value[1] for value in values if value[0] == 'load']
+        if isinstance(instruction, Read):
+            return [instruction.target]
+        if isinstance(instruction, Write):
+            return [instruction.value[1]] if instruction.value[0] == 'load' else []
+        return []
+
+    def value_names(self, values):
+        names = []
+        for value in values:
+            if value[0] == 'load':
+                names += self.identifier_names(value[1])
+        return names
+
+    def identifier_names(self, identifier):
+        if identifier[0] == 'array' and identifier[2][0] == 'load':
+            return [identifier[1], identifier[2][1]]
+        return [identifier[1]]
+
+    # times a statement ran in the profile, the static weight when it is not known
+    def weight(self, lineno, weight):
+        if self.profile is not None and lineno in self.profile:
+            return self.profile[lineno]
+        return weight
+
+    def load_registers(self, allocated):
+        for name, reg, written in allocated:
+            self.gen_number(self.memory.get_variable(name), reg)
+            self.code.append('LOAD', reg)
+            self.code.append('PUT', reg)
+            self.registers[name] = (reg, written)
+
+    # writes modified variables back at loop exit
+    def release_registers(self, allocated):
+        for name in allocated:
+            reg, written = self.registers.pop(name)
+            if written:
+                self.gen_number(self.memory.get_variable(name), 'h')
+                self.code.append('GET', reg)
+                self.code.append('STORE', 'h')
+
+    # procedures use every register, so cached variables have to be in memory during a call
+    def spill_registers(self):
+        for name, (reg, written) in self.registers.items():
+            if written:
+                self.gen_number(self.memory.get_variable(name), 'h')
+                self.code.append('GET', reg)
+                self.code.append('STORE', 'h')
+
+    def restore_registers(self):
+        for name, (reg, written) in self.registers.items():
+            self.gen_number(self.memory.get_variable(name), reg)
+            self.code.append('LOAD', reg)
+            self.code.append('PUT', reg)
+        for (array, index), reg in self.addresses.items():
+            self.element_address(array, ('load', index), reg)
+
+    def load_addresses(self, allocated):
+        for array, index, reg in allocated:
+            self.element_address(array, ('load', index), reg)
+            self.addresses[(array, index)] = reg
+
+    def release_addresses(self, allocated):
+        for array, index, reg in allocated:
+            del self.addresses[(array, index)]
+
+    # addresses follow their index, a small constant step only takes INCs
+    def update_addresses(self, instruction):
+        if instruction.target[0] != 'variable':
+            return
+        step = self.address_step(instruction)
+        for (array, index), reg in self.addresses.items():
+            if index != instruction.target[1]:
+                continue
+            if step is None:
+                self.element_address(array, ('load', index), reg)
+            else:
+                for _ in range(step):
+                    self.code.append('INC', reg)
+
+    # c of index := index + c, None for other assignments
+    def address_step(self, instruction):
+        if not isinstance(instruction, Assign) or instruction.operation != 'add':
+            return None
+        index = ('load', instruction.target)
+        for first, second in ((instruction.first, instruction.second), (instruction.second, instruction.first)):
+            if first == index and second[0] == 'number' and second[1] <= self.max_address_step:
+                return second[1]
+        return None
+
+    # weighted accesses to elements indexed by variables, less the times their addresses are computed again
+    def count_addresses(self, loop):
+        uses = dict()
+        updates = dict()
+        calls = 0
+        for block in loop.blocks:
+            if block.unreachable:
+                continue
+            weight = 10 ** (block.depth - loop.depth)
+            identifiers = [(identifier, instruction.lineno) for instruction in block.instructions for identifier in self.accessed_identifiers(instruction)]
+            if isinstance(block.terminator, Branch):
+                identifiers += [(value[1], block.terminator.lineno) for value in block.terminator.condition[1:] if value[0] == 'load']
+            for identifier, lineno in identifiers:
+                if self.indexed_element(identifier):
+                    key = (identifier[1], identifier[2][1])
+                    uses[key] = uses.get(key, 0) + self.weight(lineno, weight)
+            for instruction in block.instructions:
+                if isinstance(instruction, Call):
+                    calls += self.weight(instruction.lineno, weight)
+                elif isinstance(instruction, (Assign, Read)) and instruction.target[0] == 'variable' and self.address_step(instruction) is None:
+                    updates[instruction.target[1]] = updates.get(instruction.target[1], 0) + self.weight(instruction.lineno, weight)
+        return {key: count - updates.get(key[1], 0) - calls for key, count in uses.items()}
+
+    # array[index] of an array or an array pointer and a variable index
+    def indexed_element(self, identifier):
+        if identifier[0] != 'array' or identifier[2][0] != 'load':
+            return False
+        array = self.memory.get(identifier[1])
+        index = self.memory.get(identifier[2][1])
+        if not isinstance(index, Variable):
+            return False
+        return isinstance(array, Array) or (isinstance(array, Pointer) and array.type == 'array')
+
+    # counts accesses to scalars and to arrays behind pointers, whose values can be kept in registers
+    def count_uses(self, instruction, uses, written, weight):
+        if isinstance(instruction, Assign):
+            self.count_identifier(instruction.target, uses, weight)
+            if instruction.target[0] == 'variable':
+                written.add(instruction.target[1])
+            self.count_value(instruction.first, uses, weight)
+            if instruction.operation is not None:
+                self.count_value(instruction.second, uses, weight)
+        elif isinstance(instruction, Read):
+            self.count_identifier(instruction.target, uses, weight)
+            if instruction.target[0] == 'variable':
+                written.add(instruction.target[1])
+        elif isinstance(instruction, Write):
+            self.count_value(instruction.value, uses, weight)
+
+    def count_value(self, value, uses, weight):
+        if value[0] == 'load':
+            self.count_identifier(value[1], uses, weight)
+
+    def count_identifier(self, identifier, uses, weight):
+        # pointers are never written in the procedure, so the address they hold is kept in the register instead of a value
+        if identifier[0] == 'array' and isinstance(self.memory.get(identifier[1]), Pointer) and self.memory[identifier[1]].type == 'array':
+            uses[identifier[1]] = uses.get(identifier[1], 0) + weight
+        if identifier[0] == 'variable':
+            name = identifier[1]
+        elif identifier[2][0] == 'load':
+            name = identifier[2][1]
+        else:
+            return
+        entry = self.memory.get(name)
+        if isinstance(entry, Variable) or (isinstance(entry, Pointer) and entry.type == 'variable'):
+            uses[name] = uses.get(name, 0) + weight
+
+    # spare registers used as scratch space by the code generated for an instruction
+    def clobbered_registers(self, instruction):
+        if isinstance(instruction, Assign):
+            if instruction.operation == 'mul':
+                return {'b'}
+            elif instruction.operation == 'div' or instruction.operation == 'mod':
+                return {'b', 'c', 'd'}
+        return set()
+
+    def condition_registers(self, condition):
+        if self.zero_compared(self.simplify_condition(condition)[0]) is not None:
+            return set()
+        if condition[0] == 'eq' or condition[0] == 'neq':
+            return {'b'}
+        return set()
+
+    # finds values that are both divided and reduced modulo, so one division can give both results
+    def reset_divisions(self, function):
+        self.available = set()
+        self.division_temporaries = dict()
+        operations = set()
+        for block in function.live_blocks():
+            for instruction in block.instructions:
+                if isinstance(instruction, Assign):
+                    key = self.division_key(instruction.expression())
+                    if key is not None:
+                        operations.add(key)
+        self.divisions = {(first, second) for first, second, operation in operations if operation == 'div' and (first, second, 'mod') in operations}
+        self.block_divisions = self.available_divisions(function)
+
+    # (first, second, operation) for divisions of scalars that compute both quotient and remainder
+    def division_key(self, expression):
+        if expression[0] != 'div' and expression[0] != 'mod':
+            return None
+        values = []
+        for value in expression[1:]:
+            if value[0] == 'number':
+                values.append(value[1])
+            elif value[1][0] == 'variable' and self.is_scalar(value[1][1]):
+                values.append(value[1][1])
+            else:
+                return None
+        # division by a power of two is cheaper than saving its result
+        if isinstance(values[1], int) and values[1] & (values[1] - 1) == 0:
+            return None
+        if isinstance(values[0], int) and isinstance(values[1], int):
+            return None
+        return values[0], values[1], expression[0]
+
+    # stores the result a division computed but its assignment did not use
+    def save_other_result(self, instruction):
+        key = self.division_key(instruction.expression())
+        if key is None or key in self.available or key[:2] not in self.divisions:
+            return
+        other = (key[0], key[1], 'mod' if key[2] == 'div' else 'div')
+        if self.writes(instruction.target, key[0]) or self.writes(instruction.target, key[1]):
+            return
+        if other not in self.division_temporaries:
+            self.division_temporaries[other] = self.memory.add_temporary()
+        self.gen_number(self.division_temporaries[other], 'h')
+        # quotient is left in b, remainder in f
+        self.code.append('GET', 'b' if other[2] == 'div' else 'f')
+        self.code.append('STORE', 'h')
+
+    # divisions that still have their results saved after the instruction
+    def transfer_divisions(self, instruction, available):
+        if isinstance(instruction, Call):
+            return set()
+        if isinstance(instruction, Read):
+            return {key for key in available if not self.writes(instruction.target, key[0]) and not self.writes(instruction.target, key[1])}
+        if isinstance(instruction, Assign):
+            key = self.division_key(instruction.expression())
+            computed = key is not None and key not in available and key[:2] in self.divisions
+            available = {other for other in available if not self.writes(instruction.target, other[0]) and not self.writes(instruction.target, other[1])}
+            if computed and not self.writes(instruction.target, key[0]) and not self.writes(instruction.target, key[1]):
+                available.add((key[0], key[1], 'mod' if key[2] == 'div' else 'div'))
+            return available
+        return available
+
+    # saved results valid at the start of every block, whichever way it is reached
+    def available_divisions(self, function):
+        everything = {(first, second, operation) for first, second in self.divisions for operation in ('div', 'mod')}
+        blocks = function.live_blocks()
+        start = {block: set(everything) for block in blocks}
+        start[function.entry] = set()
+        changed = True
+        while changed:
+            changed = False
+            for block in blocks:
+                if block is not function.entry:
+                    available = set(everything) if len(block.predecessors) > 0 else set()
+                    for predecessor in block.predecessors:
+                        available &= self.available_at_end(predecessor, start[predecessor])
+                    if available != start[block]:
+                        start[block] = available
+                        changed = True
+        return start
+
+    def available_at_end(self, block, available):
+        for instruction in block.instructions:
+            available = self.transfer_divisions(instruction, available)
+        return available
+
+    def is_scalar(self, name):
+        if name not in self.memory:
+            return False
+        entry = self.memory[name]
+        return isinstance(entry, Variable) or (isinstance(entry, Pointer) and entry.type == 'variable')
+
+    # whether assigning to identifier may change the variable name, pointers may point to the same variable
+    def writes(self, identifier, name):
+        if isinstance(name, int) or identifier[0] != 'variable':
+            return False
+        if identifier[1] == name:
+            return True
+        return isinstance(self.memory.get(identifier[1]), Pointer) and isinstance(self.memory[name], Pointer)
@@ -0,0 +1,182 @@
+# replaces calls of small, single-call or hot procedures with their bodies
+# parameters are renamed to the arguments, local variables get fresh names in the caller
+
+class Inliner:
+    # procedures with at most this many commands are always inlined
+    small_size = 8
+    # larger limit for calls inside loops
+    hot_size = 40
+    # commands that may be added to the whole program by inlining
+    budget = 400
+
+    def __init__(self, profile = None):
+        # source line -> times executed in a profiled run, calls on lines missing from it are judged by loop depth
+        self.profile = profile
+        # procedure name -> number of calls in the program
+        self.calls = dict()
+        self.spent = 0
+        self.sites = 0
+
+    def count_calls(self, procedures, main):
+        for head, declarations, commands in procedures:
+            self.count_commands(commands)
+        self.count_commands(main)
+
+    def count_commands(self, commands):
+        for command in commands:
+            if command[0] == 'call':
+                name = command[1][0]
+                self.calls[name] = self.calls.get(name, 0) + 1
+            elif command[0] == 'ifelse':
+                self.count_commands(command[2])
+                self.count_commands(command[3])
+            elif command[0] == 'while' or command[0] == 'repeat':
+                self.count_commands(command[2])
+
+    # returns commands with calls replaced and [(name, size or None for variables)] of cells they need
+    def run(self, commands, procedures, memory):
+        self.procedures = procedures
+        self.memory = memory
+        self.declared = []
+        return self.inline(commands, 0), self.declared
+
+    def inline(self, commands, depth):
+        result = []
+        for command in commands:
+            if command[0] == 'call':
+                name, args, lineno = command[1]
+                procedure = self.procedures.get(name)
+                if procedure is not None and procedure.body is not None and self.worth(procedure, name, depth, lineno) and self.matches(procedure, args):
+                    self.spent += procedure.size
+                    self.sites += 1
+                    # calls mark their arguments as initialized
+                    result.append(('initialize', args))
+                    result.extend(self.substitute(procedure, args))
+                    continue
+                result.append(command)
+            elif command[0] == 'ifelse':
+                result.append(('ifelse', command[1], self.inline(command[2], depth), self.inline(command[3], depth), command[4]))
+            elif command[0] == 'while' or command[0] == 'repeat':
+                result.append((command[0], command[1], self.inline(command[2], depth + 1), command[3]))
+            else:
+                result.append(command)
+        return result
+
+    def worth(self, procedure, name, depth, lineno):
+        if self.spent + procedure.size > self.budget:
+            return False
+        if self.profile is not None and lineno in self.profile:
+            hot = self.profile[lineno] > 1
+        else:
+            hot = depth > 0
+        return self.calls.get(name, 0) == 1 or procedure.size <= self.small_size or (hot and procedure.size <= self.hot_size)
+
+    # inlined code has to behave as the call would, calls with errors are left for the generator to report
+    def matches(self, procedure, args):
+        params, locals, commands = procedure.body
+        if len(args) != len(params):
+            return False
+        for (type, param), arg in zip(params, args):
+            if arg not in self.memory:
+                return False
+            arg_type = self.memory.get_type(arg)
+            if arg_type == 'pointer':
+                arg_type = self.memory.get_pointer_type(arg)
+            elif arg_type == 'array' and any(index >= self.memory[arg].size for index in self.constant_indices(commands, param)):
+                # accesses out of bounds would become compile errors
+                return False
+            if arg_type != type:
+                return False
+        return True
+
+    def constant_indices(self, commands, name):
+        indices = []
+        def visit(identifier):
+            if identifier[0] == 'array' and identifier[1] == name and identifier[2][0] == 'number':
+                indices.append(identifier[2][1])
+        self.visit_identifiers(commands, visit)
+        return indices
+
+    def visit_identifiers(self, commands, visit):
+        for command in commands:
+            if command[0] == 'assign':
+                visit(command[1])
+                for value in self.expression_values(command[2]):
+                    if value[0] == 'load':
+                        visit(value[1])
+            elif command[0] == 'read':
+                visit(command[1])
+            elif command[0] == 'write':
+                if command[1][0] == 'load':
+                    visit(command[1][1])
+            elif command[0] == 'ifelse':
+                self.visit_identifiers(command[2], visit)
+                self.visit_identifiers(command[3], visit)
+            elif command[0] == 'while' or command[0] == 'repeat':
+                self.visit_identifiers(command[2], visit)
+
+    def expression_values(self, expression):
+        if expression[0] == 'number' or expression[0] == 'load':
+            return [expression]
+        return [expression[1], expression[2]]
+
+    def substitute(self, procedure, args):
+        params, locals, commands = procedure.body
+        names = {param: arg for (type, param), arg in zip(params, args)}
+        for name, size in locals:
+            fresh = f'{name}@{self.sites}'
+            names[name] = fresh
+            self.declared.append((fresh, size))
+        return self.rename_commands(commands, names)
+
+    def rename_commands(self, commands, names):
+        result = []
+        for command in commands:
+            if command[0] == 'assign':
+                result.append(('assign', self.rename_identifier(command[1], names), self.rename_expression(command[2], names), command[3]))
+            elif command[0] == 'read':
+                result.append(('read', self.rename_identifier(command[1], names), command[2]))
+            elif command[0] == 'write':
+                result.append(('write', self.rename_value(command[1], names), command[2]))
+            elif command[0] == 'call':
+                name, args, lineno = command[1]
+                result.append(('call', (name, [names.get(arg, arg) for arg in args], lineno)))
+            elif command[0] == 'initialize':
+                result.append(('initialize', [names.get(arg, arg) for arg in command[1]]))
+            elif command[0] == 'ifelse':
+                result.append(('ifelse', self.rename_condition(command[1], names), self.rename_commands(command[2], names), self.rename_commands(command[3], names), command[4]))
+            elif command[0] == 'while' or command[0] == 'repeat':
+                result.append((command[0], self.rename_condition(command[1], names), self.rename_commands(command[2], names), command[3]))
+        return result
+
+    def rename_identifier(self, identifier, names):
+        if identifier[0] == 'variable':
+            return 'variable', names.get(identifier[1], identifier[1])
+        return 'array', names.get(identifier[1], identifier[1]), self.rename_value(identifier[2], names)
+
+    def rename_value(self, value, names):
+        if value[0] == 'number':
+            return value
+        if isinstance(value[1], str):
+            # index of an array
+            return 'load', names.get(value[1], value[1])
+        return 'load', self.rename_identifier(value[1], names)
+
+    def rename_expression(self, expression, names):
+        if expression[0] == 'number' or expression[0] == 'load':
+            return self.rename_value(expression, names)
+        return expression[0], self.rename_value(expression[1], names), self.rename_value(expression[2], names)
+
+    def rename_condition(self, condition, names):
+        return condition[0], self.rename_value(condition[1], names), self.rename_value(condition[2], names)
+
+# number of commands, used as the size of a procedure
+def command_count(commands):
+    count = 0
+    for command in commands:
+        count += 1
+        if command[0] == 'ifelse':
+            count += command_count(command[2]) + command_count(command[3])
+        elif command[0] == 'while' or command[0] == 'repeat':
+            count += command_count(command[2])
+    return count
@@ -0,0 +1,311 @@
+# three-address intermediate representation with basic blocks
+# operands are values ('number', n) / ('load', identifier) and identifiers as produced by MyParser
+
+class Assign:
+    # target := first operation second, operation is None for a plain copy of first
+    def __init__(self, target, operation, first, second, lineno):
+        self.target = target
+        self.operation = operation
+        self.first = first
+        self.second = second
+        self.lineno = lineno
+
+    def expression(self):
+        if self.operation is None:
+            return self.first
+        return self.operation, self.first, self.second
+
+    def command(self):
+        return 'assign', self.target, self.expression(), self.lineno
+
+    def __repr__(self):
+        return f'{self.target} := {self.expression()}'
+
+class Read:
+    def __init__(self, target, lineno):
+        self.target = target
+        self.lineno = lineno
+
+    def command(self):
+        return 'read', self.target, self.lineno
+
+    def __repr__(self):
+        return f'READ {self.target}'
+
+class Write:
+    def __init__(self, value, lineno):
+        self.value = value
+        self.lineno = lineno
+
+    def command(self):
+        return 'write', self.value, self.lineno
+
+    def __repr__(self):
+        return f'WRITE {self.value}'
+
+class Call:
+    def __init__(self, name, args, lineno):
+        self.name = name
+        self.args = args
+        self.lineno = lineno
+
+    def command(self):
+        return 'call', (self.name, self.args, self.lineno)
+
+    def __repr__(self):
+        return f'CALL {self.name}({", ".join(self.args)})'
+
+# marks arguments of an inlined call as initialized, as the call would
+class Initialize:
+    def __init__(self, names):
+        self.names = names
+
+    def command(self):
+        return 'initialize', self.names
+
+    def __repr__(self):
+        return f'INITIALIZE {", ".join(self.names)}'
+
+# terminators
+
+class Jump:
+    def __init__(self, target):
+        self.target = target
+
+    def successors(self):
+        return [self.target]
+
+    def replace(self, old, new):
+        if self.target is old:
+            self.target = new
+
+    def __repr__(self):
+        return f'JUMP {self.target.label}'
+
+class Branch:
+    # condition is a tuple as produced by MyParser
+    # repeated marks a second copy of a condition, its messages were reported with the first one
+    def __init__(self, condition, true_block, false_block, lineno, repeated = False):
+        self.condition = condition
+        self.true_block = true_block
+        self.false_block = false_block
+        self.lineno = lineno
+        self.repeated = repeated
+
+    def successors(self):
+        return [self.true_block, self.false_block]
+
+    def replace(self, old, new):
+        if self.true_block is old:
+            self.true_block = new
+        if self.false_block is old:
+            self.false_block = new
+
+    def __repr__(self):
+        return f'IF {self.condition} THEN {self.true_block.label} ELSE {self.false_block.label}'
+
+class Exit:
+    def successors(self):
+        return []
+
+    def replace(self, old, new):
+        pass
+
+    def __repr__(self):
+        return 'EXIT'
+
+class BasicBlock:
+    def __init__(self, label, depth, unreachable = False):
+        self.label = label
+        # loop nesting depth, used for initialization warnings
+        self.depth = depth
+        # blocks of code removed at compile time, only checked for errors
+        self.unreachable = unreachable
+        self.instructions = []
+        self.terminator = None
+        self.predecessors = []
+
+    def successors(self):
+        return self.terminator.successors() if self.terminator is not None else []
+
+    def __repr__(self):
+        lines = [f'block {self.label} (depth {self.depth}{", unreachable" if self.unreachable else ""}):']
+        lines += [f'    {instruction}' for instruction in self.instructions]
+        lines.append(f'    {self.terminator}')
+        return '\n'.join(lines)
+
+class Loop:
+    def __init__(self, preheader, header, depth):
+        # preheader runs once before the loop, exit once after it
+        self.preheader = preheader
+        self.header = header
+        self.exit = None
+        self.depth = depth
+        self.blocks = []
+
+    def __repr__(self):
+        return f'Loop: header {self.header.label}, depth {self.depth}, blocks {[block.label for block in self.blocks]}'
+
+class Function:
+    def __init__(self, name):
+        self.name = name
+        # blocks in the order they are emitted
+        self.blocks = []
+        self.loops = []
+        self.entry = None
+
+    def add_block(self, depth, unreachable = False):
+        block = BasicBlock(len(self.blocks), depth, unreachable)
+        self.blocks.append(block)
+        return block
+
+    def live_blocks(self):
+        return [block for block in self.blocks if not block.unreachable]
+
+    def compute_predecessors(self):
+        for block in self.blocks:
+            block.predecessors = []
+        for block in self.live_blocks():
+            for successor in block.successors():
+                successor.predecessors.append(block)
+
+    def __repr__(self):
+        return '\n'.join(repr(block) for block in self.blocks)
+
+class Builder:
+    # lowers commands of a procedure or of the main program to a control flow graph
+    def build(self, name, commands):
+        self.function = Function(name)
+        self.function.entry = self.function.add_block(0)
+        end = self.build_commands(commands, self.function.entry, 0, False)
+        end.terminator = Exit()
+        self.function.compute_predecessors()
+        return self.function
+
+    def new_block(self, current, depth, unreachable):
+        block = self.function.add_block(depth, unreachable)
+        if current is not None:
+            current.terminator = Jump(block)
+        return block
+
+    # appends commands to current block, returns the block that follows them
+    def build_commands(self, commands, current, depth, unreachable):
+        for command in commands:
+            if command[0] == 'assign':
+                expression = command[2]
+                if expression[0] == 'number' or expression[0] == 'load':
+                    current.instructions.append(Assign(command[1], None, expression, None, command[3]))
+                else:
+                    current.instructions.append(Assign(command[1], expression[0], expression[1], expression[2], command[3]))
+
+            elif command[0] == 'read':
+                current.instructions.append(Read(command[1], command[2]))
+
+            elif command[0] == 'write':
+                current.instructions.append(Write(command[1], command[2]))
+
+            elif command[0] == 'call':
+                current.instructions.append(Call(*command[1]))
+
+            elif command[0] == 'initialize':
+                current.instructions.append(Initialize(command[1]))
+
+            elif command[0] == 'unreachable':
+                # kept in place, so that errors and initialization are checked in program order
+                block = self.function.add_block(depth, True)
+                self.build_commands(command[1], block, depth, True)
+                current = self.new_block(current, depth, unreachable)
+
+            elif command[0] == 'ifelse':
+                branch = current
+                # else block comes first when the generator swaps the condition
+                blocks = []
+                for block in ([command[3], command[2]] if command[1][0] in ('neq', 'geq', 'leq') else [command[2], command[3]]):
+                    start = self.function.add_block(depth, unreachable)
+                    blocks.append((start, self.build_commands(block, start, depth, unreachable)))
+                join = self.function.add_block(depth, unreachable)
+                for start, end in blocks:
+                    end.terminator = Jump(join)
+                if command[1][0] in ('neq', 'geq', 'leq'):
+                    branch.terminator = Branch(command[1], blocks[1][0], blocks[0][0], command[4])
+                else:
+                    branch.terminator = Branch(command[1], blocks[0][0], blocks[1][0], command[4])
+                current = join
+
+            elif command[0] == 'while':
+                # rotated, the condition is checked once before the loop and then at the end of every iteration
+                # the first check belongs to the loop's depth, as it did before the loop was rotated
+                guard = self.new_block(current, depth + 1, unreachable)
+                preheader = self.function.add_block(depth, unreachable)
+                header = self.new_block(preheader, depth + 1, unreachable)
+                loop = self.start_loop(preheader, header, depth, unreachable)
+                end = self.build_commands(command[2], header, depth + 1, unreachable)
+                exit = self.function.add_block(depth, unreachable)
+                self.end_loop(loop, exit)
+                current = self.new_block(exit, depth, unreachable)
+                guard.terminator = Branch(command[1], preheader, current, command[3])
+                end.terminator = Branch(command[1], header, exit, command[3], True)
+
+            elif command[0] == 'repeat':
+                preheader = self.new_block(current, depth, unreachable)
+                header = self.new_block(preheader, depth + 1, unreachable)
+                loop = self.start_loop(preheader, header, depth, unreachable)
+                end = self.build_commands(command[2], header, depth + 1, unreachable)
+                current = self.function.add_block(depth, unreachable)
+                end.terminator = Branch(command[1], current, header, command[3])
+                self.end_loop(loop, current)
+
+        return current
+
+    def start_loop(self, preheader, header, depth, unreachable):
+        loop = Loop(preheader, header, depth)
+        if not unreachable:
+            self.function.loops.append(loop)
+        return loop
+
+    # blocks from the header up to the exit belong to the loop
+    # labels are positions in the function while it is being built
+    def end_loop(self, loop, exit):
+        loop.exit = exit
+        loop.blocks = self.function.blocks[loop.header.label:-1]
+
+class PassManager:
+    # runs registered passes over every function, a pass is called with the function and the memory of its scope
+    def __init__(self):
+        self.passes = []
+
+    def register(self, name, function_pass):
+        self.passes.append((name, function_pass))
+
+    def run(self, function, memory):
+        for name, function_pass in self.passes:
+            function_pass(function, memory)
+            function.compute_predecessors()
+        return function
+
+# blocks that only jump somewhere else are bypassed, loop preheaders and exits are kept for the generator
+def bypass_empty_blocks(function, memory):
+    kept = set()
+    for loop in function.loops:
+        kept.update([loop.preheader, loop.exit, loop.header])
+    kept.add(function.entry)
+
+    def destination(block):
+        seen = set()
+        while block not in kept and len(block.instructions) == 0 and isinstance(block.terminator, Jump) and block not in seen:
+            seen.add(block)
+            block = block.terminator.target
+        return block
+
+    for block in function.live_blocks():
+        for successor in block.successors():
+            target = destination(successor)
+            if target is not successor:
+                block.terminator.replace(successor, target)
+
+    referenced = set(kept)
+    for block in function.live_blocks():
+        referenced.update(block.successors())
+    function.blocks = [block for block in function.blocks if block.unreachable or block in referenced]
+    for loop in function.loops:
+        loop.blocks = [block for block in loop.blocks if block.unreachable or block in referenced]
@@ -0,0 +1,305 @@
+# optimizations of the final VM program, jump targets are renumbered after instructions are removed
+
+jumps = ('JUMP', 'JPOS', 'JZERO')
+registers = ('a', 'b', 'c', 'd', 'e', 'f', 'g', 'h')
+
+class Peephole:
+    rules = ['redundant copy', 'redundant load', 'constant rebuild', 'dead write', 'jump to next', 'jump threading', 'decided jump', 'unreachable code']
+
+    def __init__(self, rules = None):
+        self.enabled = set(self.rules if rules is None else rules)
+        for rule in self.enabled:
+            if rule not in self.rules:
+                raise Exception(f'unknown peephole rule {rule}')
+        # rule -> number of instructions it removed or changed
+        self.report = {rule: 0 for rule in self.rules if rule in self.enabled}
+
+    # program is [(operation, argument)] with jumps to addresses, see Code.program
+    def run(self, program):
+        # number of instructions before the optimization
+        self.size = len(program)
+        # index in the program of every instruction left
+        self.origins = list(range(len(program)))
+        program = list(program)
+        self.changed = True
+        while self.changed:
+            self.changed = False
+            for optimization in (self.number_values, self.remove_dead_writes, self.simplify_jumps):
+                removed = optimization(program)
+                if removed:
+                    self.changed = True
+                    program = self.renumber(program, removed)
+                    self.origins = [origin for index, origin in enumerate(self.origins) if index not in removed]
+        return program
+
+    def count(self, rule, removed, index):
+        self.report[rule] += 1
+        removed.add(index)
+
+    # positions that may be reached other than from the previous instruction
+    def targets(self, program):
+        targets = {0}
+        for index, (operation, argument) in enumerate(program):
+            if operation in jumps:
+                targets.add(argument)
+            elif operation == 'STRK':
+                # a procedure returns 3 instructions after the STRK of its call
+                targets.add(index + 3)
+        return targets
+
+    # STRK, STORE and JUMP of a call have to stay next to each other
+    def pinned(self, program):
+        pinned = set()
+        for index, (operation, argument) in enumerate(program):
+            if operation == 'STRK':
+                pinned.update([index, index + 1, index + 2])
+        return pinned
+
+    def renumber(self, program, removed):
+        new_index = []
+        position = 0
+        for index in range(len(program) + 1):
+            new_index.append(position)
+            if index not in removed:
+                position += 1
+        result = []
+        for index, (operation, argument) in enumerate(program):
+            if index in removed:
+                continue
+            if operation in jumps:
+                argument = new_index[argument]
+            result.append((operation, argument))
+        return result
+
+    # local value numbering, instructions that do not change any value are removed
+    def number_values(self, program):
+        removed = set()
+        targets = self.targets(program)
+        pinned = self.pinned(program)
+        self.fresh = 0
+        values = self.unknown_registers()
+        memory = dict()
+        index = 0
+        while index < len(program):
+            if index in targets:
+                values = self.unknown_registers()
+                memory = dict()
+            operation, argument = program[index]
+
+            if index in pinned:
+                pass
+            elif operation == 'RST' and 'constant rebuild' in self.enabled:
+                end, value = self.rebuild(program, index, targets, values[argument])
+                if end is not None:
+                    for position in range(index, end):
+                        self.count('constant rebuild', removed, position)
+                    index = end
+                    continue
+            elif operation == 'GET' and values['a'] == values[argument] and 'redundant copy' in self.enabled:
+                self.count('redundant copy', removed, index)
+                index += 1
+                continue
+            elif operation == 'PUT' and values['a'] == values[argument] and 'redundant copy' in self.enabled:
+                self.count('redundant copy', removed, index)
+                index += 1
+                continue
+            elif operation == 'LOAD' and values[argument] in memory and 'redundant load' in self.enabled:
+                value = memory[values[argument]]
+                if values['a'] == value:
+                    self.count('redundant load', removed, index)
+                    index += 1
+                    continue
+                holder = next((reg for reg in registers if values[reg] == value), None)
+                if holder is not None:
+                    program[index] = ('GET', holder)
+                    self.report['redundant load'] += 1
+                    self.changed = True
+                    operation, argument = program[index]
+
+            self.execute(operation, argument, values, memory)
+            index += 1
+        return removed
+
+    def unknown_registers(self):
+        values = dict()
+        for reg in registers:
+            values[reg] = self.new_value()
+        return values
+
+    # unknown values are numbered, known constants are ('constant', value)
+    def new_value(self):
+        self.fresh += 1
+        return self.fresh
+
+    # RST reg followed by INC, DEC, SHL and SHR of reg that only rebuild the value it had
+    def rebuild(self, program, start, targets, value):
+        if not isinstance(value, tuple):
+            return None, None
+        reg = program[start][1]
+        number = 0
+        end = start + 1
+        best = None
+        while end < len(program) and end not in targets and program[end][1] == reg and program[end][0] in ('INC', 'DEC', 'SHL', 'SHR'):
+            number = self.constant(program[end][0], number)
+            end += 1
+            if number == value[1]:
+                best = end
+        if best is None and value[1] == 0:
+            best = start + 1
+        # the longest run ending with the same value, later instructions still change it
+        return best, value
+
+    def constant(self, operation, value):
+        if operation == 'INC':
+            return value + 1
+        elif operation == 'DEC':
+            return max(0, value - 1)
+        elif operation == 'SHL':
+            return value * 2
+        else: # operation == 'SHR'
+            return value // 2
+
+    def execute(self, operation, argument, values, memory):
+        if operation == 'GET':
+            values['a'] = values[argument]
+        elif operation == 'PUT':
+            values[argument] = values['a']
+        elif operation == 'LOAD':
+            address = values[argument]
+            if address in memory:
+                values['a'] = memory[address]
+            else:
+                values['a'] = self.new_value()
+                memory[address] = values['a']
+        elif operation == 'STORE':
+            address = values[argument]
+            # a store through an unknown address may change any cell but itself
+            for other in list(memory):
+                if other != address and not (isinstance(other, tuple) and isinstance(address, tuple)):
+                    del memory[other]
+            memory[address] = values['a']
+        elif operation in ('ADD', 'SUB'):
+            first = values['a']
+            second = values[argument]
+            if isinstance(first, tuple) and isinstance(second, tuple):
+                values['a'] = ('constant', first[1] + second[1] if operation == 'ADD' else max(0, first[1] - second[1]))
+            else:
+                values['a'] = self.new_value()
+        elif operation == 'RST':
+            values[argument] = ('constant', 0)
+        elif operation in ('INC', 'DEC', 'SHL', 'SHR'):
+            value = values[argument]
+            if isinstance(value, tuple):
+                values[argument] = ('constant', self.constant(operation, value[1]))
+            else:
+                values[argument] = self.new_value()
+        elif operation == 'READ':
+            values['a'] = self.new_value()
+        elif operation == 'STRK':
+            values[argument] = self.new_value()
+
+    # writes to registers that are overwritten before being read, everything is live at the end of a block
+    def remove_dead_writes(self, program):
+        removed = set()
+        if 'dead write' not in self.enabled:
+            return removed
+        targets = self.targets(program)
+        pinned = self.pinned(program)
+        live = set(registers)
+        for index in range(len(program) - 1, -1, -1):
+            operation, argument = program[index]
+            if operation in jumps or operation in ('JUMPR', 'HALT') or index + 1 in targets:
+                live = set(registers)
+            written, read = self.effects(operation, argument)
+            if written is not None and written not in live and index not in pinned and operation not in ('READ', 'STRK'):
+                self.count('dead write', removed, index)
+                continue
+            if written is not None:
+                live.discard(written)
+            live.update(read)
+        return removed
+
+    # (register written, registers read) by an instruction
+    def effects(self, operation, argument):
+        if operation == 'GET':
+            return 'a', {argument}
+        elif operation == 'PUT':
+            return argument, {'a'}
+        elif operation == 'LOAD':
+            return 'a', {argument}
+        elif operation == 'STORE':
+            return None, {'a', argument}
+        elif operation in ('ADD', 'SUB'):
+            return 'a', {'a', argument}
+        elif operation == 'RST':
+            return argument, set()
+        elif operation in ('INC', 'DEC', 'SHL', 'SHR'):
+            return argument, {argument}
+        elif operation == 'READ':
+            return 'a', set()
+        elif operation == 'WRITE':
+            return None, {'a'}
+        elif operation == 'STRK':
+            return argument, set()
+        elif operation in ('JPOS', 'JZERO'):
+            return None, {'a'}
+        elif operation == 'JUMPR':
+            return None, {argument}
+        return None, set()
+
+    def simplify_jumps(self, program):
+        removed = set()
+        pinned = self.pinned(program)
+
+        # jumps to unconditional jumps go straight to their destination
+        if 'jump threading' in self.enabled:
+            for index, (operation, argument) in enumerate(program):
+                if operation in jumps:
+                    target = argument
+                    seen = set()
+                    while target < len(program) and program[target][0] == 'JUMP' and target not in seen:
+                        seen.add(target)
+                        target = program[target][1]
+                    if target != argument:
+                        program[index] = (operation, target)
+                        self.report['jump threading'] += 1
+                        self.changed = True
+
+        if 'decided jump' in self.enabled:
+            self.decide_jumps(program, pinned)
+
+        for index, (operation, argument) in enumerate(program):
+            if operation in jumps and argument == index + 1 and index not in pinned and 'jump to next' in self.enabled:
+                self.count('jump to next', removed, index)
+
+        # instructions after unconditional jumps that nothing jumps to
+        if 'unreachable code' in self.enabled:
+            targets = self.targets(program)
+            reachable = True
+            for index, (operation, argument) in enumerate(program):
+                if index in targets:
+                    reachable = True
+                if not reachable and index not in pinned and index not in removed:
+                    self.count('unreachable code', removed, index)
+                if operation in ('JUMP', 'JUMPR', 'HALT'):
+                    reachable = False
+        return removed
+
+    # conditional jumps on a known value of a become unconditional
+    def decide_jumps(self, program, pinned):
+        targets = self.targets(program)
+        self.fresh = 0
+        values = self.unknown_registers()
+        memory = dict()
+        for index, (operation, argument) in enumerate(program):
+            if index in targets:
+                values = self.unknown_registers()
+                memory = dict()
+            if operation in ('JPOS', 'JZERO') and isinstance(values['a'], tuple) and index not in pinned:
+                value = values['a'][1]
+                taken = value > 0 if operation == 'JPOS' else value == 0
+                # a jump that is never taken becomes a jump to the next instruction
+                program[index] = ('JUMP', argument if taken else index + 1)
+                self.report['decided jump'] += 1
+                self.changed = True
+            self.execute(operation, argument, values, memory)
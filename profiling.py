@@ -0,0 +1,73 @@
+# execution counts of source lines, from a run of the compiled program on blockvm.py
+# the profile of a program is passed back to compiler.py with --profile to guide inlining and register allocation
+import argparse
+import hashlib
+import json
+import sys
+from vm import MachineError
+from blockvm import BlockMachine
+
+def source_hash(text):
+    return hashlib.sha256(text.encode()).hexdigest()
+
+# {line: times executed} from the source map of the code and the execution count of every instruction
+# a line executed in several places, e.g. an inlined procedure, gets the sum of them
+def line_counts(source_map, address_counts):
+    counts = dict()
+    previous = None
+    for origin, count in zip(source_map, address_counts):
+        lineno = origin[0]
+        # the first instruction of a statement runs once every time the statement does, later ones may be in loops
+        if lineno is not None and origin != previous:
+            counts[lineno] = counts.get(lineno, 0) + count
+        previous = origin
+    return counts
+
+def write_profile(path, text, counts):
+    with open(path, 'w') as file:
+        json.dump({'source': source_hash(text), 'lines': {str(lineno): count for lineno, count in sorted(counts.items())}}, file, indent=1)
+        file.write('\n')
+
+# {line: times executed}, or None with a warning when the profile was made for another version of the source
+def read_profile(path, text):
+    with open(path) as file:
+        profile = json.load(file)
+    if profile.get('source') != source_hash(text):
+        print(f'Warning: profile {path} is for a different source, it is ignored')
+        return None
+    return {int(lineno): count for lineno, count in profile['lines'].items()}
+
+def main():
+    from compiler import compile_source
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('input', help='program to profile, its inputs are read from stdin')
+    arguments.add_argument('profile', nargs='?', help='profile to write, the input with .profile appended by default')
+    arguments.add_argument('--profile', dest='previous', help='profile used when compiling the program for the run')
+    arguments.add_argument('--limit', type=int, default=None, help='maximal number of executed instructions')
+    options = arguments.parse_args()
+
+    with open(options.input) as in_f:
+        text = in_f.read()
+    stats = dict()
+    profile = None if options.previous is None else read_profile(options.previous, text)
+    code, peephole = compile_source(text, None, stats, profile)
+    if code is None:
+        return 1
+    machine = BlockMachine.parse('\n'.join(code))
+    inputs = [int(word) for word in sys.stdin.read().split()]
+    try:
+        for value in machine.run(inputs, options.limit):
+            print(f'> {value}')
+    except MachineError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        return 1
+    print(f'cost: {machine.cost}; i/o: {machine.io_cost}')
+
+    counts = line_counts(stats['source map'], machine.address_counts)
+    path = options.profile or f'{options.input}.profile'
+    write_profile(path, text, counts)
+    print(f'profile of {len(counts)} lines saved to {path}')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# whether an argument at position is passed to the procedure by value, None is an undeclared procedure
+def passed_by_value(procedure, position):
+    return procedure is not None and position < len(procedure.pointers) and procedure.pointers[position].by_value
+
+class ConstantPropagation:
+    # procedures are the Procedure objects of the generator, arguments they take by value keep their values
+    def __init__(self, memory, procedures = None):
+        self.memory = memory
+        self.procedures = dict() if procedures is None else procedures
+
+    def run(self, commands):
+        commands, known = self.propagate(commands, dict())
+        return commands
+
+    # returns commands with known values substituted and values known after them
+    def propagate(self, commands, known):
+        result = []
+        for command in commands:
+            if command[0] == 'assign':
+                target = self.fold_identifier(command[1], known)
+                expression = self.fold_expression(command[2], known)
+                self.kill(target, known)
+                key = self.key(target)
+                if key is not None and expression[0] == 'number':
+                    known[key] = expression[1]
+                result.append(('assign', target, expression, command[3]))
+
+            elif command[0] == 'read':
+                target = self.fold_identifier(command[1], known)
+                self.kill(target, known)
+                result.append(('read', target, command[2]))
+
+            elif command[0] == 'write':
+                result.append(('write', self.fold_value(command[1], known), command[2]))
+
+            elif command[0] == 'call':
+                self.kill_arguments(command, known)
+                result.append(command)
+
+            elif command[0] == 'ifelse':
+                condition = self.fold_condition(command[1], known)
+                decision = self.decide(condition)
+                # blocks in the order the generator emits them, as it affects initialization checks
+                blocks = [(command[2], decision != False), (command[3], decision != True)]
+                if command[1][0] in ('neq', 'geq', 'leq'):
+                    blocks.reverse()
+
+                if decision is None:
+                    block_a, known_a = self.propagate(command[2], dict(known))
+                    block_b, known_b = self.propagate(command[3], dict(known))
+                    known.clear()
+                    known.update(self.meet(known_a, known_b))
+                    result.append(('ifelse', condition, block_a, block_b, command[4]))
+                else:
+                    for block, live in blocks:
+                        if live:
+                            block, after = self.propagate(block, dict(known))
+                            result.extend(block)
+                        elif len(block) > 0:
+                            result.append(('unreachable', block))
+                    known.clear()
+                    known.update(after)
+
+            elif command[0] == 'while':
+                if self.decide(self.fold_condition(command[1], known)) == False:
+                    result.append(('unreachable', [command]))
+                    continue
+                head = self.loop_head(command, known)
+                block, _ = self.propagate(command[2], dict(head))
+                result.append(('while', self.fold_condition(command[1], head), block, command[3]))
+                known.clear()
+                known.update(head)
+
+            elif command[0] == 'repeat':
+                head = self.loop_head(command, known)
+                block, after = self.propagate(command[2], dict(head))
+                result.append(('repeat', self.fold_condition(command[1], after), block, command[3]))
+                known.clear()
+                known.update(after)
+
+            else:
+                result.append(command)
+        return result, known
+
+    # values known at the start of every iteration of a loop, cells the loop may assign are dropped
+    # one pass over the body, so nested loops do not propagate their bodies again for every outer iteration
+    def loop_head(self, loop, known):
+        head = dict(known)
+        self.kill_assigned(loop[2], head)
+        return head
+
+    def kill_assigned(self, commands, known):
+        for command in commands:
+            if command[0] == 'assign' or command[0] == 'read':
+                self.kill(command[1], known)
+            elif command[0] == 'call':
+                self.kill_arguments(command, known)
+            elif command[0] == 'ifelse':
+                self.kill_assigned(command[2], known)
+                self.kill_assigned(command[3], known)
+            elif command[0] == 'while' or command[0] == 'repeat':
+                self.kill_assigned(command[2], known)
+
+    def meet(self, first, second):
+        return {key: value for key, value in first.items() if second.get(key) == value}
+
+    # ('variable' or 'array', whether it is a procedure parameter) for declared names
+    def describe(self, name):
+        if name not in self.memory:
+            return None, False
+        type = self.memory.get_type(name)
+        if type == 'pointer':
+            return self.memory.get_pointer_type(name), True
+        return type, False
+
+    # memory cell an identifier refers to, if it is known at compile time
+    def key(self, identifier):
+        type, pointer = self.describe(identifier[1])
+        if identifier[0] == 'variable' and type == 'variable':
+            return identifier[1]
+        if identifier[0] == 'array' and type == 'array' and identifier[2][0] == 'number':
+            return identifier[1], identifier[2][1]
+        return None
+
+    def kill(self, identifier, known):
+        name = identifier[1]
+        if identifier[0] == 'variable':
+            known.pop(name, None)
+        elif identifier[2][0] == 'number':
+            known.pop((name, identifier[2][1]), None)
+        else:
+            self.kill_array(name, known)
+        self.kill_pointers(name, known)
+
+    # arguments passed by reference may be changed by the procedure
+    def kill_arguments(self, command, known):
+        procedure = self.procedures.get(command[1][0])
+        for position, arg in enumerate(command[1][1]):
+            if not passed_by_value(procedure, position):
+                self.kill_all(arg, known)
+
+    # procedures may change every argument they receive
+    def kill_all(self, name, known):
+        known.pop(name, None)
+        self.kill_array(name, known)
+        self.kill_pointers(name, known)
+
+    def kill_array(self, name, known):
+        for key in [key for key in known if isinstance(key, tuple) and key[0] == name]:
+            del known[key]
+
+    # parameters of the same type may refer to the same memory
+    def kill_pointers(self, name, known):
+        type, pointer = self.describe(name)
+        if not pointer:
+            return
+        for key in list(known):
+            other = key[0] if isinstance(key, tuple) else key
+            if self.describe(other) == (type, True):
+                del known[key]
+
+    def fold_identifier(self, identifier, known):
+        if identifier[0] == 'array' and identifier[2][0] == 'load':
+            index = known.get(self.key(('variable', identifier[2][1])))
+            type, pointer = self.describe(identifier[1])
+            # indices out of bounds are left for the program to fail on
+            if index is not None and type == 'array' and (pointer or index < self.memory[identifier[1]].size):
+                return 'array', identifier[1], ('number', index)
+        return identifier
+
+    def fold_value(self, value, known):
+        if value[0] == 'load':
+            identifier = self.fold_identifier(value[1], known)
+            key = self.key(identifier)
+            if key is not None and key in known:
+                return 'number', known[key]
+            return 'load', identifier
+        return value
+
+    def fold_expression(self, expression, known):
+        if expression[0] == 'number' or expression[0] == 'load':
+            return self.fold_value(expression, known)
+        first = self.fold_value(expression[1], known)
+        second = self.fold_value(expression[2], known)
+        if first[0] == 'number' and second[0] == 'number':
+            return 'number', self.evaluate(expression[0], first[1], second[1])
+        return expression[0], first, second
+
+    def fold_condition(self, condition, known):
+        return condition[0], self.fold_value(condition[1], known), self.fold_value(condition[2], known)
+
+    # value of a condition known at compile time, otherwise None
+    def decide(self, condition):
+        operator, first, second = condition
+        if first[0] != 'number' or second[0] != 'number':
+            return None
+        first = first[1]
+        second = second[1]
+        if operator == 'eq':
+            return first == second
+        elif operator == 'neq':
+            return first != second
+        elif operator == 'gt':
+            return first > second
+        elif operator == 'lt':
+            return first < second
+        elif operator == 'geq':
+            return first >= second
+        else: # operator == 'leq'
+            return first <= second
+
+    def evaluate(self, operation, first, second):
+        if operation == 'add':
+            return first + second
+        elif operation == 'sub':
+            return max(0, first - second)
+        elif operation == 'mul':
+            return first * second
+        elif second == 0:
+            return 0
+        elif operation == 'div':
+            return first // second
+        else: # operation == 'mod'
+            return first % second
@@ -0,0 +1,58 @@
+# times parsing and code generation of generated programs with long flat blocks of statements
+# the time per statement should stay the same as the programs grow
+import argparse
+import io
+import sys
+import time
+from contextlib import redirect_stdout
+from compiler import MyLexer, MyParser
+from generator import Generator
+from peephole import Peephole
+
+def generate_source(statements):
+    lines = ['PROGRAM IS', '  x, y, z, t[10]', 'IN', '  READ x;', '  y := 1;']
+    for i in range(statements):
+        kind = i % 4
+        if kind == 0:
+            lines.append('  y := y + x;')
+        elif kind == 1:
+            lines.append(f'  z := y * {i % 7 + 2};')
+        elif kind == 2:
+            lines.append(f'  t[{i % 10}] := z - x;')
+        else:
+            lines.append(f'  x := t[{(i + 3) % 10}] + 1;')
+    lines += ['  WRITE y;', 'END']
+    return '\n'.join(lines) + '\n'
+
+# (parse seconds, generation seconds)
+def measure(source):
+    start = time.perf_counter()
+    program = MyParser().parse(MyLexer().tokenize(source))
+    parsed = time.perf_counter()
+    with redirect_stdout(io.StringIO()):
+        generator = Generator()
+        generator.gen_program(*program)
+        Peephole().run(generator.code.program())
+    generated = time.perf_counter()
+    return parsed - start, generated - parsed
+
+def main():
+    arguments = argparse.ArgumentParser()
+    arguments.add_argument('--sizes', default='5000,10000,20000,40000', help='comma separated statement counts')
+    arguments.add_argument('--tolerance', type=float, default=2.0, help='allowed growth of the parse time per statement between the smallest and the largest program')
+    options = arguments.parse_args()
+    sizes = [int(size) for size in options.sizes.split(',')]
+
+    print(f'{"statements":>10} {"parse s":>9} {"us/stmt":>8} {"generate s":>11} {"us/stmt":>8}')
+    per_statement = []
+    for size in sizes:
+        parse, generate = measure(generate_source(size))
+        per_statement.append(parse / size)
+        print(f'{size:>10} {parse:>9.3f} {parse / size * 1e6:>8.1f} {generate:>11.3f} {generate / size * 1e6:>8.1f}')
+
+    growth = per_statement[-1] / per_statement[0]
+    print(f'parse time per statement grew {growth:.2f}x')
+    return 1 if growth > options.tolerance else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,82 @@
+# LALR tables of Sly parsers saved on disk, so they are not rebuilt every time the compiler starts
+import hashlib
+import os
+import pickle
+import time
+from types import SimpleNamespace
+import sly
+from sly.yacc import ParserMeta, Production
+
+cache_directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '__pycache__')
+
+class CachedParserMeta(ParserMeta):
+    # class name -> (seconds spent on its tables, whether they were loaded from the cache)
+    timings = dict()
+
+    def __new__(meta, clsname, bases, attributes):
+        start = time.perf_counter()
+        functions = rule_functions(attributes)
+        key = tables_key(attributes, functions)
+        path = os.path.join(cache_directory, f'{clsname}.tables')
+        tables = load_tables(path, key)
+        if tables is None:
+            cls = super().__new__(meta, clsname, bases, attributes)
+            save_tables(path, key, cls, functions)
+        else:
+            del attributes['_']
+            cls = type.__new__(meta, clsname, bases, attributes)
+            restore_tables(cls, tables, functions)
+        meta.timings[clsname] = (time.perf_counter() - start, tables is not None)
+        return cls
+
+# (function name, rules) -> function, for every grammar rule in definition order
+def rule_functions(attributes):
+    functions = dict()
+    for name, value in attributes.items():
+        while callable(value) and hasattr(value, 'rules'):
+            functions[(value.__name__, tuple(value.rules))] = value
+            value = getattr(value, 'next_func', None)
+    return functions
+
+# changes whenever the grammar or Sly change
+def tables_key(attributes, functions):
+    specification = (sly.__version__, sorted(attributes.get('tokens', ())), attributes.get('precedence'), attributes.get('start'), list(functions))
+    return hashlib.sha256(repr(specification).encode()).hexdigest()
+
+def load_tables(path, key):
+    try:
+        with open(path, 'rb') as file:
+            tables = pickle.load(file)
+    except Exception:
+        # a truncated or stale file may fail in many ways, the tables are built again then
+        return None
+    if not isinstance(tables, dict) or tables.get('key') != key:
+        return None
+    return tables
+
+def save_tables(path, key, cls, functions):
+    keys = {function: key for key, function in functions.items()}
+    tables = {
+        'key': key,
+        'productions': [(p.number, p.name, p.prod, p.prec, keys.get(p.func), p.file, p.line) for p in cls._grammar.Productions],
+        'action': cls._lrtable.lr_action,
+        'goto': cls._lrtable.lr_goto,
+        'defaulted_states': cls._lrtable.defaulted_states,
+    }
+    # written to a temporary file first, so that concurrent compilers never read half of it
+    temporary = f'{path}.{os.getpid()}'
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(temporary, 'wb') as file:
+            pickle.dump(tables, file)
+        os.replace(temporary, path)
+    except OSError:
+        pass
+
+# parse() only needs the productions and the action, goto and default state tables
+def restore_tables(cls, tables, functions):
+    productions = []
+    for number, name, prod, prec, key, file, line in tables['productions']:
+        productions.append(Production(number, name, prod, prec, functions.get(key), file, line))
+    cls._grammar = SimpleNamespace(Productions=productions)
+    cls._lrtable = SimpleNamespace(lr_action=tables['action'], lr_goto=tables['goto'], defaulted_states=tables['defaulted_states'])
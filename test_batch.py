@@ -0,0 +1,40 @@
+# batch compilation reports programs with errors as failed and writes nothing for them
+import sys
+import batch
+
+valid = '''PROGRAM IS
+  x
+IN
+  READ x;
+  WRITE x;
+END
+'''
+
+invalid = '''PROGRAM IS
+  x
+IN
+  x := ;
+END
+'''
+
+def run(monkeypatch, arguments):
+    monkeypatch.setattr(sys, 'argv', ['batch.py'] + arguments)
+    return batch.main()
+
+def test_syntax_error(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'syn.imp').write_text(invalid)
+    (tmp_path / 'ok.imp').write_text(valid)
+    output_dir = tmp_path / 'out'
+    assert run(monkeypatch, [str(tmp_path / 'syn.imp'), str(tmp_path / 'ok.imp'), '--output-dir', str(output_dir)]) == 1
+    assert not (output_dir / 'syn.mr').exists()
+    assert (output_dir / 'ok.mr').exists()
+    assert 'syn.imp: failed' in capsys.readouterr().out
+
+def test_syntax_error_cached(tmp_path, monkeypatch, capsys):
+    (tmp_path / 'syn.imp').write_text(invalid)
+    output_dir = tmp_path / 'out'
+    arguments = [str(tmp_path / 'syn.imp'), '--output-dir', str(output_dir), '--cache', str(tmp_path / 'cache')]
+    for attempt in range(2):
+        assert run(monkeypatch, arguments) == 1
+        assert not (output_dir / 'syn.mr').exists()
+        assert 'Syntax error' in capsys.readouterr().out
@@ -0,0 +1,35 @@
+# the block-translating machine has to agree with the reference machine on everything it reports
+import os
+import pytest
+from vm import Machine, MachineError
+from blockvm import BlockMachine
+from compiler import compile_source
+from benchmark import cases
+from test_vm import program
+
+directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'example_programs')
+
+def assert_same(text, inputs, limit = None):
+    reference = Machine.parse(text, 0)
+    machine = BlockMachine.parse(text, 0)
+    assert machine.run(inputs, limit) == reference.run(inputs, limit)
+    assert (machine.cost, machine.io_cost, machine.steps) == (reference.cost, reference.io_cost, reference.steps)
+    assert machine.operation_counts == reference.operation_counts
+    assert machine.address_counts == reference.address_counts
+
+def test_fixed_program():
+    assert_same(program, [4])
+
+def test_instruction_limit():
+    # 53 instructions run before the HALT, which does not count against the limit
+    assert_same(program, [4], 53)
+    for machine in (Machine.parse(program, 0), BlockMachine.parse(program, 0)):
+        with pytest.raises(MachineError):
+            machine.run([4], 52)
+
+@pytest.mark.parametrize('path, inputs, expected', cases)
+def test_example(path, inputs, expected):
+    with open(os.path.join(directory, path)) as file:
+        code, peephole = compile_source(file.read())
+    assert code is not None
+    assert_same('\n'.join(code), inputs)
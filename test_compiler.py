@@ -0,0 +1,804 @@
+# compiles small programs and checks what they write on the reference machine
+# the expected outputs are those of the compiler before the optimizations
+import os
+import pytest
+from compiler import compile_source
+from peephole import Peephole
+from vm import Machine
+from benchmark import cases
+
+# a program that runs longer than this is taken to never end
+step_limit = 5000000
+
+def run(source, inputs = (), peephole_rules = None):
+    code, peephole = compile_source(source, peephole_rules)
+    assert code is not None
+    return Machine.parse('\n'.join(code), 0).run(inputs, step_limit)
+
+# statements repeated until a procedure is too large to be inlined at a call in a loop
+def repeated(lines, times = 24):
+    return ''.join(f'    {line}\n' for line in lines) * times
+
+# big takes the cells of the arguments of p by reference, p keeps them in spare registers during its loop
+# every argument of big after the first used to be read from b after b got the address of a parameter cell
+def test_call_with_cached_pointers():
+    source = f'''PROCEDURE big(x, y) IS
+  k
+IN
+  k := 0;
+  WHILE k < 2 DO
+{repeated(['x := x + y;', 'y := y + 1;'])}    x := x % 1000;
+    k := k + 1;
+  ENDWHILE
+END
+
+PROCEDURE p(b, c, r) IS
+  i
+IN
+  i := 0;
+  REPEAT
+    b := b + c;
+    c := c + i;
+    b := b + i;
+    c := c + b;
+    r := r + 1;
+    big(r, r);
+    i := i + 1;
+  UNTIL i > 2;
+  b := b + 1;
+  big(b, c);
+END
+
+PROGRAM IS
+  w, x, v
+IN
+  w := 1;
+  x := 2;
+  v := 3;
+  p(w, x, v);
+  WRITE v;
+  p(x, w, v);
+  WRITE x;
+END
+'''
+    assert run(source) == [71, 373]
+
+# with the counter of the loop in run passed at a wrong address, the loop never ended
+def test_call_with_cached_loop_counter():
+    source = f'''PROCEDURE step(s, t, k) IS
+  j
+IN
+  j := 0;
+  WHILE j < 2 DO
+{repeated(['s := s + k;', 't := t + s;'])}    j := j + 1;
+  ENDWHILE
+  s := s % 1000;
+  t := t % 1000;
+  k := k + 1;
+END
+
+PROCEDURE run(n, s, t, k) IS
+IN
+  k := 0;
+  WHILE k < n DO
+    s := s + n;
+    t := t + n;
+    s := s + n;
+    t := t + s;
+    step(s, t, k);
+  ENDWHILE
+  WRITE s;
+  WRITE t;
+END
+
+PROGRAM IS
+  n, s, t, k
+IN
+  READ n;
+  READ s;
+  t := 0;
+  run(n, s, t, k);
+  run(n, t, s, k);
+  step(s, t, k);
+  WRITE k;
+END
+'''
+    assert run(source, [50, 1613]) == [413, 650, 450, 713, 51]
+
+# the base of the array t is cached in b in the loop of p, after the first argument of big it was overwritten
+def test_call_with_cached_array_base():
+    source = f'''PROCEDURE big(x, T y) IS
+  k
+IN
+  k := 0;
+  WHILE k < 2 DO
+{repeated(['x := x + y[0];', 'y[1] := y[1] + x;'])}    x := x % 97;
+    y[1] := y[1] % 89;
+    k := k + 1;
+  ENDWHILE
+END
+
+PROCEDURE p(T t) IS
+  i, j, u, v, w
+IN
+  i := 0;
+  j := 0;
+  u := 1;
+  v := 2;
+  w := 3;
+  REPEAT
+    u := u + v;
+    v := v + w;
+    w := w + u;
+    u := u + w;
+    v := v + u;
+    w := w + v;
+    j := t[1] + t[2];
+    j := j + t[1];
+    w := w + t[0];
+    big(j, t);
+    i := i + 1;
+  UNTIL i > 2;
+  t[0] := j;
+  big(j, t);
+  WRITE u;
+END
+
+PROGRAM IS
+  a[3]
+IN
+  a[0] := 1;
+  a[1] := 2;
+  a[2] := 3;
+  p(a);
+  p(a);
+  WRITE a[0];
+  WRITE a[1];
+  WRITE a[2];
+END
+'''
+    assert run(source) == [485, 685, 23, 39, 3]
+
+# division and modulo by 0 give 0 whether the zero is read, written in the program or a constant
+def test_division_by_zero():
+    source = '''PROGRAM IS
+  a, b, c, d
+IN
+  READ a;
+  READ b;
+  c := a / b;
+  WRITE c;
+  c := a % b;
+  WRITE c;
+  c := a / b;
+  d := a % b;
+  WRITE c;
+  WRITE d;
+  c := a / 0;
+  WRITE c;
+  c := a % 0;
+  WRITE c;
+END
+'''
+    assert run(source, [7, 0]) == [0, 0, 0, 0, 0, 0]
+    assert run(source, [7, 3]) == [2, 1, 2, 1, 0, 0]
+
+# constant divisors are shifted out or divided without a loop of the generated code
+def test_division_by_constants():
+    source = '''PROGRAM IS
+  a, b
+IN
+  READ a;
+  b := a / 1;
+  WRITE b;
+  b := a % 1;
+  WRITE b;
+  b := a / 8;
+  WRITE b;
+  b := a % 8;
+  WRITE b;
+  b := a / 10;
+  WRITE b;
+  b := a % 10;
+  WRITE b;
+  b := 0 / a;
+  WRITE b;
+  b := 1000 % a;
+  WRITE b;
+END
+'''
+    for a in [0, 1, 7, 8, 123456789]:
+        expected = [a, 0, a // 8, a % 8, a // 10, a % 10, 0, 1000 % a if a > 0 else 0]
+        assert run(source, [a]) == expected
+
+# a divisor known to be 0 at compile time gives the same results as one read at run time
+def test_division_by_propagated_zero():
+    source = '''PROGRAM IS
+  a, z, c
+IN
+  READ a;
+  z := 0;
+  c := a / z;
+  WRITE c;
+  c := a % z;
+  WRITE c;
+  z := z * a;
+  c := a % z;
+  WRITE c;
+END
+'''
+    assert run(source, [7]) == [0, 0, 0]
+
+# constants assigned before loops are forgotten when inner loops or procedures change them
+def test_constants_in_nested_loops():
+    source = '''PROCEDURE bump(x) IS
+IN
+  x := x + 1;
+END
+
+PROGRAM IS
+  i, j, k, x, y, n
+IN
+  READ n;
+  x := 1;
+  y := 2;
+  i := 0;
+  WHILE i < n DO
+    j := 0;
+    REPEAT
+      k := 0;
+      WHILE k < 2 DO
+        IF x > 3 THEN
+          y := y + x;
+        ENDIF
+        k := k + 1;
+      ENDWHILE
+      x := x + 1;
+      j := j + 1;
+    UNTIL j = 2;
+    bump(y);
+    i := i + 1;
+  ENDWHILE
+  WRITE x;
+  WRITE y;
+END
+'''
+    assert run(source, [0]) == [1, 2]
+    assert run(source, [3]) == [7, 35]
+
+# loop scalars kept in spare registers, next to multiplication, division and comparisons that use them as scratch
+def test_registers_in_nested_loops():
+    source = '''PROCEDURE add(x, y) IS
+IN
+  x := x + y;
+END
+
+PROGRAM IS
+  n, i, j, s, p, q, r, u, t[4]
+IN
+  READ n;
+  s := 0;
+  p := 1;
+  q := 0;
+  r := 0;
+  i := 0;
+  WHILE i < n DO
+    j := i;
+    WHILE j > 0 DO
+      s := s + j;
+      u := i * j;
+      q := q + u;
+      u := j % 4;
+      t[u] := s;
+      j := j - 1;
+    ENDWHILE
+    p := p * 3;
+    p := p % 1000;
+    IF s = p THEN
+      r := r + 1;
+    ENDIF
+    u := s / 7;
+    r := r + u;
+    add(r, i);
+    i := i + 1;
+  ENDWHILE
+  WRITE s;
+  WRITE p;
+  WRITE q;
+  WRITE r;
+  WRITE t[0];
+  WRITE t[3];
+END
+'''
+    assert run(source, [0]) == [0, 1, 0, 0, 0, 0]
+    assert run(source, [9]) == [120, 683, 750, 81, 114, 117]
+
+# constant factors become chains of shifts and additions or subtractions, on either side of the multiplication
+def test_multiplication_by_constants():
+    factors = [0, 1, 2, 3, 7, 10, 15, 255, 1000, 123456789]
+    lines = []
+    for factor in factors:
+        lines += [f'  b := a * {factor};', '  WRITE b;', f'  b := {factor} * a;', '  WRITE b;']
+    source = 'PROGRAM IS\n  a, b, c\nIN\n  READ a;\n  READ c;\n' + '\n'.join(lines) + '\n  b := a * c;\n  WRITE b;\nEND\n'
+    for a, c in [(0, 5), (1, 0), (1, 1), (37, 1), (2 ** 40 + 3, 12345)]:
+        expected = [a * factor for factor in factors for side in range(2)] + [a * c]
+        assert run(source, [a, c]) == expected
+
+# a division and a remainder of the same operands share one division, unless an operand changes between them
+def test_shared_division():
+    source = '''PROGRAM IS
+  a, b, c, d, i
+IN
+  READ a;
+  READ b;
+  c := a / b;
+  d := a % b;
+  WRITE c;
+  WRITE d;
+  d := 100 % b;
+  c := 100 / b;
+  WRITE c;
+  WRITE d;
+  c := a / 7;
+  d := a % 7;
+  WRITE c;
+  WRITE d;
+  i := 0;
+  WHILE i < 3 DO
+    c := a % b;
+    a := a / b;
+    d := a % b;
+    WRITE c;
+    WRITE d;
+    i := i + 1;
+  ENDWHILE
+  b := a / b;
+  d := a % b;
+  WRITE b;
+  WRITE d;
+END
+'''
+    def expected(a, b):
+        div = lambda x, y: x // y if y > 0 else 0
+        mod = lambda x, y: x % y if y > 0 else 0
+        output = [div(a, b), mod(a, b), div(100, b), mod(100, b), div(a, 7), mod(a, 7)]
+        for i in range(3):
+            output.append(mod(a, b))
+            a = div(a, b)
+            output.append(mod(a, b))
+        b = div(a, b)
+        return output + [b, mod(a, b)]
+    for a, b in [(1000, 3), (12345, 10), (5, 0), (0, 4), (99, 1)]:
+        assert run(source, [a, b]) == expected(a, b)
+
+# every peephole rule keeps what the example programs write, alone and with all the others
+@pytest.mark.parametrize('rules', [[]] + [[rule] for rule in Peephole.rules] + [Peephole.rules])
+def test_peephole_rules(rules):
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'example_programs')
+    for path, inputs, expected in cases:
+        with open(os.path.join(directory, path)) as file:
+            assert run(file.read(), inputs, rules) == expected
+
+# inlined calls with several scalar and array arguments, the same variable passed twice and calls inside inlined bodies
+def test_inlined_calls():
+    source = '''PROCEDURE swap(x, y) IS
+  t
+IN
+  t := x;
+  x := y;
+  y := t;
+END
+
+PROCEDURE accumulate(T v, i, s) IS
+IN
+  s := s + v[i];
+  v[i] := s;
+END
+
+PROCEDURE twice(x, y) IS
+IN
+  swap(x, y);
+  x := x + y;
+  swap(x, y);
+END
+
+PROGRAM IS
+  n, i, a, b, s, t[5]
+IN
+  READ n;
+  a := 1;
+  b := 2;
+  s := 0;
+  i := 0;
+  WHILE i < 5 DO
+    t[i] := i;
+    i := i + 1;
+  ENDWHILE
+  i := 0;
+  WHILE i < n DO
+    swap(a, b);
+    accumulate(t, a, s);
+    twice(a, b);
+    twice(s, s);
+    a := a % 5;
+    b := b % 5;
+    i := i + 1;
+  ENDWHILE
+  WRITE a;
+  WRITE b;
+  WRITE s;
+  WRITE t[0];
+  WRITE t[1];
+  WRITE t[2];
+  WRITE t[3];
+  WRITE t[4];
+END
+'''
+    def expected(n):
+        a, b, s, t = 1, 2, 0, [0, 1, 2, 3, 4]
+        for i in range(n):
+            a, b = b, a
+            s += t[a]
+            t[a] = s
+            a, b = b, a
+            a += b
+            a, b = b, a
+            s = 2 * s
+            a %= 5
+            b %= 5
+        return [a, b, s] + t
+    for n in [0, 1, 4, 9]:
+        assert run(source, [n]) == expected(n)
+
+# cells are laid out by how often they are accessed, arrays of every size have to keep their elements apart
+def test_memory_layout():
+    source = '''PROGRAM IS
+  a[100], x, b[3], c[1000], y, hot
+IN
+  READ x;
+  y := 0;
+  hot := 0;
+  WHILE hot < 300 DO
+    b[0] := hot;
+    c[hot] := x;
+    a[y] := hot;
+    y := y + 1;
+    y := y % 100;
+    hot := hot + 1;
+    x := x + hot;
+  ENDWHILE
+  WRITE a[0];
+  WRITE a[99];
+  WRITE b[0];
+  WRITE c[0];
+  WRITE c[299];
+  WRITE x;
+  WRITE y;
+  WRITE hot;
+END
+'''
+    x = 5
+    a, c = [0] * 100, [0] * 300
+    y = 0
+    for hot in range(300):
+        c[hot] = x
+        a[y] = hot
+        y = (y + 1) % 100
+        x += hot + 1
+    assert run(source, [5]) == [a[0], a[99], 299, c[0], c[299], x, y, 300]
+
+# procedures that are never active together share frame cells, a caller's locals have to survive its calls
+def test_overlaid_frames():
+    def procedure(name, calls):
+        body = ''.join(f'  {call};\n' for call in calls)
+        return f'''PROCEDURE {name}(x, y) IS
+  l, m
+IN
+  l := x + 1;
+  m := y + 2;
+{body}  l := l + x;
+  m := m + y;
+  l := l * 2;
+  m := m * 3;
+  x := l + m;
+  l := x % 1000;
+  m := l + 1;
+  x := m;
+END
+'''
+    source = procedure('left', []) + procedure('right', []) + procedure('middle', ['left(y, x)', 'right(x, y)']) + '''
+PROGRAM IS
+  a, b
+IN
+  READ a;
+  READ b;
+  middle(a, b);
+  WRITE a;
+  left(a, b);
+  WRITE a;
+  middle(b, a);
+  WRITE b;
+  right(b, b);
+  WRITE b;
+END
+'''
+    def step(x, y, calls = ()):
+        l, m = x + 1, y + 2
+        for call in calls:
+            x, y = call(x, y)
+        l = (l + x) * 2
+        m = (m + y) * 3
+        return (l + m) % 1000 + 1, y
+    def leaf(x, y):
+        return step(x, y)
+    def middle(x, y):
+        def left(x, y):
+            y, x = leaf(y, x)
+            return x, y
+        return step(x, y, [left, leaf])
+    a, b = 3, 4
+    output = []
+    a, b = middle(a, b)
+    output.append(a)
+    a, b = leaf(a, b)
+    output.append(a)
+    b, a = middle(b, a)
+    output.append(b)
+    b, _ = leaf(b, b)
+    output.append(b)
+    assert run(source, [3, 4]) == output
+
+# comparisons with 0 jump on the value itself, while loops check their condition before the first and after every iteration
+def test_zero_comparisons_and_loops():
+    operators = {'=': lambda x, y: x == y, '!=': lambda x, y: x != y, '>': lambda x, y: x > y,
+                 '<': lambda x, y: x < y, '>=': lambda x, y: x >= y, '<=': lambda x, y: x <= y}
+    lines = []
+    for operator in operators:
+        lines += [f'  IF x {operator} 0 THEN WRITE 1; ELSE WRITE 0; ENDIF',
+                  f'  IF 0 {operator} x THEN WRITE 1; ELSE WRITE 0; ENDIF']
+    source = 'PROGRAM IS\n  x, y, c\nIN\n  READ x;\n' + '\n'.join(lines) + '''
+  y := x;
+  c := 0;
+  WHILE y > 0 DO
+    y := y - 1;
+    c := c + 1;
+  ENDWHILE
+  WRITE c;
+  y := x;
+  WHILE 0 != y DO
+    y := y - 1;
+    c := c + 1;
+  ENDWHILE
+  WRITE c;
+  y := x;
+  WHILE y < 3 DO
+    y := y + 1;
+    c := c + 1;
+  ENDWHILE
+  WRITE c;
+  y := x;
+  REPEAT
+    c := c + 1;
+    IF y > 0 THEN
+      y := y - 1;
+    ENDIF
+  UNTIL y = 0;
+  WRITE c;
+END
+'''
+    for x in [0, 1, 5]:
+        expected = []
+        for compare in operators.values():
+            expected += [int(compare(x, 0)), int(compare(0, x))]
+        expected += [x, 2 * x, 2 * x + max(0, 3 - x), 2 * x + max(0, 3 - x) + max(1, x)]
+        assert run(source, [x]) == expected
+
+# products and quotients of values a loop does not change are computed once before it
+# operands changed by an inner loop, a call or through a pointer to the same cell keep them in the loop
+def test_hoisted_invariants():
+    source = '''PROCEDURE grow(x) IS
+IN
+  x := x + 1;
+END
+
+PROCEDURE mix(a, b, s) IS
+  i, t
+IN
+  t := 0;
+  i := 0;
+  WHILE i < 3 DO
+    t := a * b;
+    s := s + t;
+    b := b + 1;
+    t := a / 3;
+    s := s + t;
+    i := i + 1;
+  ENDWHILE
+END
+
+PROGRAM IS
+  n, m, i, j, s, t, u
+IN
+  READ n;
+  READ m;
+  s := 0;
+  i := 0;
+  WHILE i < 4 DO
+    j := 0;
+    WHILE j < 3 DO
+      t := n * m;
+      u := n / m;
+      s := s + t;
+      s := s + u;
+      t := i * m;
+      s := s + t;
+      j := j + 1;
+    ENDWHILE
+    t := m % n;
+    s := s + t;
+    grow(m);
+    i := i + 1;
+  ENDWHILE
+  WRITE s;
+  mix(n, m, s);
+  WRITE s;
+  mix(s, s, s);
+  WRITE s;
+END
+'''
+    def expected(n, m):
+        div = lambda x, y: x // y if y > 0 else 0
+        mod = lambda x, y: x % y if y > 0 else 0
+        s = 0
+        for i in range(4):
+            for j in range(3):
+                s += n * m + div(n, m) + i * m
+            s += mod(m, n)
+            m += 1
+        output = [s]
+        for i in range(3):
+            s += n * m
+            m += 1
+            s += n // 3
+        output.append(s)
+        for i in range(3):
+            s = s + s * s
+            s = s + 1
+            s = s + s // 3
+        return output + [s]
+    for n, m in [(7, 3), (0, 5), (12, 0)]:
+        assert run(source, [n, m]) == expected(n, m)
+
+# addresses of elements indexed by a variable follow it in registers, with INCs for small steps
+def test_addresses_following_the_index():
+    source = '''PROCEDURE fill(T v, n, step) IS
+  i
+IN
+  i := 0;
+  WHILE i < n DO
+    v[i] := i;
+    i := i + step;
+  ENDWHILE
+END
+
+PROCEDURE skip(x) IS
+IN
+  x := x + 3;
+END
+
+PROGRAM IS
+  a[40], b[40], i, s, n, size, one, five
+IN
+  READ n;
+  size := 40;
+  one := 1;
+  five := 5;
+  fill(a, size, one);
+  fill(b, size, one);
+  fill(a, n, five);
+  i := 0;
+  WHILE i < 40 DO
+    b[i] := a[i] + b[i];
+    i := i + 2;
+  ENDWHILE
+  i := 1;
+  WHILE i < 40 DO
+    a[i] := b[i];
+    i := i + 4;
+  ENDWHILE
+  i := 39;
+  s := 0;
+  WHILE i > 0 DO
+    s := s + a[i];
+    i := i - 1;
+  ENDWHILE
+  WRITE s;
+  i := 0;
+  WHILE i < 36 DO
+    s := s + b[i];
+    skip(i);
+    s := s + a[i];
+    i := i + 1;
+  ENDWHILE
+  WRITE s;
+END
+'''
+    def expected(n):
+        a, b = list(range(40)), list(range(40))
+        for i in range(0, n, 5):
+            a[i] = i
+        for i in range(0, 40, 2):
+            b[i] = a[i] + b[i]
+        for i in range(1, 40, 4):
+            a[i] = b[i]
+        s = sum(a[i] for i in range(39, 0, -1))
+        output = [s]
+        i = 0
+        while i < 36:
+            s += b[i] + a[i + 3]
+            i += 4
+        return output + [s]
+    for n in [0, 17, 40]:
+        assert run(source, [n]) == expected(n)
+
+# read-only parameters are passed by value, unless the argument may be the same variable as a written parameter
+def test_parameters_by_value():
+    source = f'''PROCEDURE scale(n, f, r) IS
+  i
+IN
+  i := 0;
+  WHILE i < n DO
+{repeated(['r := r + f;'], 12)}    i := i + 1;
+  ENDWHILE
+END
+
+PROCEDURE outer(a, b, c) IS
+IN
+  scale(a, b, c);
+  WRITE c;
+  scale(b, a, c);
+  WRITE c;
+  scale(a, c, c);
+  WRITE c;
+END
+
+PROGRAM IS
+  x, y, z
+IN
+  READ x;
+  y := 2;
+  z := 0;
+  outer(x, y, z);
+  scale(x, y, y);
+  WRITE y;
+  z := 1;
+  outer(x, x, z);
+  WRITE z;
+END
+'''
+    # cells are a dict, so that arguments passed for several parameters stay the same cell
+    def scale(cells, n, f, r):
+        i = 0
+        while i < cells[n]:
+            for repeat in range(12):
+                cells[r] += cells[f]
+            i += 1
+    def outer(cells, output, a, b, c):
+        scale(cells, a, b, c)
+        output.append(cells[c])
+        scale(cells, b, a, c)
+        output.append(cells[c])
+        scale(cells, a, c, c)
+        output.append(cells[c])
+    def expected(x):
+        cells = {'x': x, 'y': 2, 'z': 0}
+        output = []
+        outer(cells, output, 'x', 'y', 'z')
+        scale(cells, 'x', 'y', 'y')
+        output.append(cells['y'])
+        cells['z'] = 1
+        outer(cells, output, 'x', 'x', 'z')
+        output.append(cells['z'])
+        return output
+    for x in [0, 1, 2]:
+        assert run(source, [x]) == expected(x)
@@ -0,0 +1,26 @@
+# parser tables saved by another version, or only partly written, are built again instead of failing
+import pickle
+from tables import load_tables
+
+def test_broken_files(tmp_path):
+    path = tmp_path / 'MyParser.tables'
+    contents = [
+        b'',
+        pickle.dumps({'key': 'k', 'productions': []})[:-3],
+        # a newer pickle protocol
+        b'\x80\x09',
+        # a function that no longer exists
+        b'cbuiltins\nno_such_function\n.',
+        b'not a pickle',
+    ]
+    for content in contents:
+        path.write_bytes(content)
+        assert load_tables(str(path), 'k') is None
+    assert load_tables(str(tmp_path / 'missing.tables'), 'k') is None
+
+def test_other_key(tmp_path):
+    path = tmp_path / 'MyParser.tables'
+    path.write_bytes(pickle.dumps({'key': 'old'}))
+    assert load_tables(str(path), 'new') is None
+    path.write_bytes(pickle.dumps({'key': 'new'}))
+    assert load_tables(str(path), 'new') == {'key': 'new'}
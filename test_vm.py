@@ -0,0 +1,51 @@
+# runs a fixed program on the reference machine, every benchmark number depends on its costs
+import pytest
+from vm import Machine, MachineError
+
+# sums 1..n in a loop, then goes through memory, shifts and a call with STRK / JUMPR
+program = '''READ
+PUT c
+RST d
+RST b
+GET c
+JZERO 11
+GET d
+ADD c
+PUT d
+DEC c
+JUMP 4
+GET d
+STORE b
+INC b
+SHL d
+GET d
+SUB b
+STORE b
+STRK g
+JUMP 23
+LOAD b
+WRITE
+HALT
+RST b
+LOAD b
+SHR a
+WRITE
+INC b
+INC g
+INC g
+JUMPR g
+'''
+
+def test_output_and_cost():
+    machine = Machine.parse(program, 0)
+    # s = 10, writes s / 2 and then 2 s - 1
+    assert machine.run([4]) == [5, 19]
+    # 1 READ and 2 WRITE, 4 LOAD / STORE, 5 ADD / SUB, 41 other instructions and HALT
+    assert machine.io_cost == 300
+    assert machine.cost == 566
+    assert machine.steps == 54
+
+def test_instruction_limit():
+    machine = Machine.parse(program, 0)
+    with pytest.raises(MachineError):
+        machine.run([4], 20)
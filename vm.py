@@ -0,0 +1,166 @@
+# interpreter of the register machine from virtual_machine/, with the same semantics and costs as mw.cc
+# numbers are unbounded, as in mw-cln.cc
+import random
+import sys
+
+registers = ('a', 'b', 'c', 'd', 'e', 'f', 'g', 'h')
+costs = {'LOAD': 50, 'STORE': 50, 'ADD': 5, 'SUB': 5}
+io_costs = {'READ': 100, 'WRITE': 100}
+with_register = ('LOAD', 'STORE', 'ADD', 'SUB', 'GET', 'PUT', 'RST', 'INC', 'DEC', 'SHL', 'SHR', 'STRK', 'JUMPR')
+with_address = ('JUMP', 'JPOS', 'JZERO')
+
+class MachineError(Exception):
+    pass
+
+class Machine:
+    def __init__(self, program, seed = None):
+        # [(operation, register or address)]
+        self.program = program
+        self.random = random.Random(seed)
+
+    @classmethod
+    def parse(cls, text, seed = None):
+        program = []
+        for lineno, line in enumerate(text.splitlines(), 1):
+            parts = line.split('#')[0].split()
+            if len(parts) == 0:
+                continue
+            operation = parts[0]
+            if operation in with_register and len(parts) == 2 and parts[1] in registers:
+                program.append((operation, parts[1]))
+            elif operation in with_address and len(parts) == 2 and parts[1].isdigit():
+                program.append((operation, int(parts[1])))
+            elif operation in ('READ', 'WRITE', 'HALT') and len(parts) == 1:
+                program.append((operation, None))
+            else:
+                raise MachineError(f'line {lineno}: invalid instruction {line.strip()}')
+        return cls(program, seed)
+
+    @classmethod
+    def load(cls, path, seed = None):
+        with open(path) as file:
+            return cls.parse(file.read(), seed)
+
+    # runs the program, inputs are consumed by READ, limit is the maximal number of executed instructions
+    def run(self, inputs = (), limit = None):
+        program = self.program
+        inputs = list(inputs)
+        memory = dict()
+        # registers start with random values, as in mw.cc
+        r = {reg: self.random.randrange(2 ** 31) for reg in registers}
+        self.output = []
+        self.cost = 0
+        self.io_cost = 0
+        self.steps = 0
+        # operation -> times executed, instruction address -> times executed
+        self.operation_counts = {operation: 0 for operation in with_register + with_address + ('READ', 'WRITE', 'HALT')}
+        self.address_counts = [0] * len(program)
+
+        lr = 0
+        if len(program) == 0:
+            raise MachineError('empty program')
+        while True:
+            operation, x = program[lr]
+            self.steps += 1
+            self.operation_counts[operation] += 1
+            self.address_counts[lr] += 1
+            if operation == 'HALT':
+                break
+            if limit is not None and self.steps > limit:
+                raise MachineError(f'more than {limit} instructions executed')
+
+            if operation == 'READ':
+                if len(inputs) == 0:
+                    raise MachineError(f'READ at {lr} with no input left')
+                r['a'] = inputs.pop(0)
+                self.io_cost += 100
+                lr += 1
+            elif operation == 'WRITE':
+                self.output.append(r['a'])
+                self.io_cost += 100
+                lr += 1
+            elif operation == 'LOAD':
+                r['a'] = memory.get(r[x], 0)
+                self.cost += 50
+                lr += 1
+            elif operation == 'STORE':
+                memory[r[x]] = r['a']
+                self.cost += 50
+                lr += 1
+            elif operation == 'ADD':
+                r['a'] += r[x]
+                self.cost += 5
+                lr += 1
+            elif operation == 'SUB':
+                r['a'] -= min(r['a'], r[x])
+                self.cost += 5
+                lr += 1
+            elif operation == 'GET':
+                r['a'] = r[x]
+                self.cost += 1
+                lr += 1
+            elif operation == 'PUT':
+                r[x] = r['a']
+                self.cost += 1
+                lr += 1
+            elif operation == 'RST':
+                r[x] = 0
+                self.cost += 1
+                lr += 1
+            elif operation == 'INC':
+                r[x] += 1
+                self.cost += 1
+                lr += 1
+            elif operation == 'DEC':
+                if r[x] > 0:
+                    r[x] -= 1
+                self.cost += 1
+                lr += 1
+            elif operation == 'SHL':
+                r[x] <<= 1
+                self.cost += 1
+                lr += 1
+            elif operation == 'SHR':
+                r[x] >>= 1
+                self.cost += 1
+                lr += 1
+            elif operation == 'JUMP':
+                lr = x
+                self.cost += 1
+            elif operation == 'JPOS':
+                lr = x if r['a'] > 0 else lr + 1
+                self.cost += 1
+            elif operation == 'JZERO':
+                lr = x if r['a'] == 0 else lr + 1
+                self.cost += 1
+            elif operation == 'STRK':
+                r[x] = lr
+                self.cost += 1
+                lr += 1
+            else: # operation == 'JUMPR'
+                lr = r[x]
+                self.cost += 1
+
+            if lr < 0 or lr >= len(program):
+                raise MachineError(f'call of nonexistent instruction {lr}')
+
+        self.cost += self.io_cost
+        return self.output
+
+    # cost paid for each instruction address, in the same units as the total cost
+    def address_costs(self):
+        return [count * (costs.get(operation) or io_costs.get(operation) or (0 if operation == 'HALT' else 1)) for count, (operation, x) in zip(self.address_counts, self.program)]
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print(f'usage: {sys.argv[0]} program', file=sys.stderr)
+        sys.exit(1)
+    machine = Machine.load(sys.argv[1])
+    inputs = [int(word) for word in sys.stdin.read().split()]
+    try:
+        for value in machine.run(inputs):
+            print(f'> {value}')
+    except MachineError as e:
+        print(f'Error: {e}', file=sys.stderr)
+        sys.exit(1)
+    print(f'cost: {machine.cost}; i/o: {machine.io_cost}')